@@ -0,0 +1,101 @@
+"""Embedding throughput (chunks/sec) vs. batch size and worker count.
+
+Builds a fixed corpus of synthetic PDFs, parses and splits it the same
+way PDFProcessor does, then embeds the chunks with EmbeddingPipeline
+under each configuration:
+
+  * in-process, for every batch size x torch thread count
+  * process pool, for every batch size x worker count
+  * concurrent uploads (one thread per PDF), with and without coalescing
+
+    python benchmarks/bench_embedding.py --batch-sizes 16,32,64,128 --threads 1,2,4 --workers 2,4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.document_loaders import PyPDFLoader
+from embeddings import EmbeddingPipeline, get_embeddings, set_torch_threads
+from pdf_processor import PDFProcessor
+from synthetic_pdf import write_corpus
+
+def load_corpus(corpus_dir: str, count: int, pages: int):
+    """Chunk texts per PDF, split exactly like PDFProcessor"""
+    splitter = PDFProcessor().text_splitter
+    corpus = []
+    for path in write_corpus(corpus_dir, count, pages):
+        chunks = splitter.split_documents(PyPDFLoader(path).load())
+        corpus.append([chunk.page_content for chunk in chunks])
+    return corpus
+
+def measure(pipeline: EmbeddingPipeline, corpus, concurrent: bool = False) -> dict:
+    texts = [text for doc in corpus for text in doc]
+    start = time.perf_counter()
+    if concurrent:
+        threads = [threading.Thread(target=pipeline.embed, args=(doc,)) for doc in corpus]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        pipeline.embed(texts)
+    elapsed = time.perf_counter() - start
+    return {"chunks": len(texts), "seconds": round(elapsed, 3), "chunks_per_sec": round(len(texts) / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default="bench_data/corpus")
+    parser.add_argument("--pdfs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--batch-sizes", default="16,32,64,128")
+    parser.add_argument("--threads", default="1,2,4", help="torch thread counts for in-process runs")
+    parser.add_argument("--workers", default="2,4", help="process pool sizes; empty to skip")
+    parser.add_argument("--coalesce-ms", type=float, default=20)
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    corpus = load_corpus(args.corpus_dir, args.pdfs, args.pages)
+    # Load the model and run one warmup call outside the timings
+    get_embeddings().embed_documents(corpus[0][:8])
+
+    results = {"corpus": {"pdfs": args.pdfs, "pages": args.pages, "chunks": sum(len(doc) for doc in corpus)}, "runs": []}
+
+    def record(mode: str, **config):
+        run = dict(mode=mode, **config)
+        print(json.dumps(run), file=sys.stderr)
+        results["runs"].append(run)
+
+    for threads in [int(t) for t in args.threads.split(",")]:
+        set_torch_threads(threads)
+        for batch_size in batch_sizes:
+            pipeline = EmbeddingPipeline(batch_size=batch_size, process_workers=0, coalesce_ms=0)
+            record("in_process", batch_size=batch_size, torch_threads=threads, **measure(pipeline, corpus))
+
+    for workers in [int(w) for w in args.workers.split(",") if w]:
+        for batch_size in batch_sizes:
+            pipeline = EmbeddingPipeline(batch_size=batch_size, process_workers=workers, coalesce_ms=0, torch_threads=1)
+            # Start every worker's model before timing
+            pipeline.embed(corpus[0][:batch_size * workers])
+            record("process_pool", batch_size=batch_size, workers=workers, **measure(pipeline, corpus))
+            pipeline.close()
+
+    # Small per-upload batches are where sharing model calls across uploads pays off
+    small_batch = min(batch_sizes)
+    for coalesce_ms in (0, args.coalesce_ms):
+        pipeline = EmbeddingPipeline(batch_size=small_batch, process_workers=0, coalesce_ms=coalesce_ms)
+        record("concurrent_uploads", batch_size=small_batch, coalesce_ms=coalesce_ms, **measure(pipeline, corpus, concurrent=True))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
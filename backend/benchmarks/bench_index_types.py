@@ -0,0 +1,123 @@
+"""Recall@k vs. query latency for the vector index types in index_factory.
+
+Builds a synthetic corpus per --sizes: unit-length vectors drawn around
+--topics random centres, which clusters the way sentence embeddings of
+a document collection do. Queries are perturbed corpus vectors. Exact
+neighbours come from a flat index; every other type is scored against
+them while sweeping its search knob (nprobe for IVF, efSearch for HNSW):
+
+    python benchmarks/bench_index_types.py --sizes 10000,100000 --k 4
+
+The "auto" field of each size is the type VECTOR_INDEX_TYPE=auto picks.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+import index_factory
+from index_factory import build_index, choose_index_type
+
+def synthetic_corpus(n: int, dim: int, topics: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, topics, n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.05 * rng.standard_normal(
+        (count, corpus.shape[1]), dtype=np.float32
+    )
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    index.search(queries[:1], k)
+    latencies = []
+    found = np.empty_like(truth)
+    for i, query in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found[i] = ids[0]
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+    return {f"recall@{k}": round(float(recall), 4), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--types", default="flat,ivf_flat,ivf_pq,hnsw")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", default="1,4,8,16,32,64")
+    parser.add_argument("--ef-search", default="16,32,64,128")
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads (the server searches one query at a time)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        corpus = synthetic_corpus(size, args.dim, args.topics, args.seed)
+        queries = make_queries(corpus, args.queries, args.seed)
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(corpus)
+        _, truth = exact.search(queries, args.k)
+        entry = {"chunks": size, "auto": choose_index_type(size, "auto"), "types": {}}
+
+        for kind in args.types.split(","):
+            # Forced types still fall back to flat when there is too little data to train
+            if choose_index_type(size, kind) != kind:
+                entry["types"][kind] = {"skipped": f"too few chunks, would build {choose_index_type(size, kind)}"}
+                continue
+            started = time.perf_counter()
+            index = build_index(corpus, kind)
+            stats = {
+                "build_seconds": round(time.perf_counter() - started, 2),
+                "size_mb": round(len(faiss.serialize_index(index)) / 1e6, 1),
+                "runs": []
+            }
+            if kind in ("ivf_flat", "ivf_pq"):
+                ivf = faiss.extract_index_ivf(index)
+                stats["nlist"] = ivf.nlist
+                for nprobe in [int(n) for n in args.nprobe.split(",") if int(n) <= ivf.nlist]:
+                    ivf.nprobe = nprobe
+                    stats["runs"].append({"nprobe": nprobe, **measure(index, queries, truth, args.k)})
+            elif kind == "hnsw":
+                for ef in [int(e) for e in args.ef_search.split(",")]:
+                    index.hnsw.efSearch = ef
+                    stats["runs"].append({"ef_search": ef, **measure(index, queries, truth, args.k)})
+            else:
+                stats["runs"].append(measure(index, queries, truth, args.k))
+            entry["types"][kind] = stats
+            print(json.dumps({"chunks": size, "type": kind, **stats}), file=sys.stderr)
+        results.append(entry)
+
+    output = json.dumps({
+        "dim": args.dim,
+        "k": args.k,
+        "defaults": {
+            "VECTOR_IVF_MIN_CHUNKS": index_factory.VECTOR_IVF_MIN_CHUNKS,
+            "VECTOR_PQ_MIN_CHUNKS": index_factory.VECTOR_PQ_MIN_CHUNKS,
+            "VECTOR_IVF_NPROBE": index_factory.VECTOR_IVF_NPROBE,
+            "VECTOR_HNSW_EF_SEARCH": index_factory.VECTOR_HNSW_EF_SEARCH
+        },
+        "sizes": results
+    }, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Peak memory of PDF ingestion vs. page count: whole-document load vs. streaming.
+
+Each case runs in a fresh subprocess so peak RSS is not polluted by
+earlier runs. Reported per case:
+
+  * traced_peak_mb  - peak Python heap during ingestion (tracemalloc)
+  * rss_peak_mb     - process peak RSS after ingestion (includes the model)
+  * index_mb        - size of the resulting float32 vectors, which any
+                      ingestion path must hold; streaming bounds everything else
+
+    python benchmarks/bench_ingest_memory.py --pages 10,100,400
+    python benchmarks/bench_ingest_memory.py --fake     # parsing/splitting only
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def ingest_whole(processor, path, embeddings):
+    """Pre-streaming behaviour: load every page, split, then embed everything"""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import FAISS
+    documents = PyPDFLoader(path).load()
+    texts = processor.text_splitter.split_documents(documents)
+    return FAISS.from_documents(texts, embeddings)
+
+def run_case(mode: str, pages: int, fake: bool, corpus_dir: str) -> dict:
+    import embeddings as embeddings_module
+    from langchain_community.embeddings import FakeEmbeddings
+    from pdf_processor import PDFProcessor
+    from synthetic_pdf import write_corpus
+
+    if fake:
+        fake_model = FakeEmbeddings(size=384)
+        embeddings_module._embeddings = fake_model
+    model = embeddings_module.get_embeddings()
+    model.embed_documents(["warmup"])
+
+    path = write_corpus(corpus_dir, 1, pages)[0]
+    copy = f"{path}.{mode}.pdf"
+    with open(path, "rb") as src, open(copy, "wb") as dst:
+        dst.write(src.read())
+
+    processor = PDFProcessor()
+    tracemalloc.start()
+    if mode == "whole":
+        store = ingest_whole(processor, copy, model)
+        os.remove(copy)
+    else:
+        store = processor.process_pdf(copy)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mode": mode,
+        "pages": pages,
+        "chunks": store.index.ntotal,
+        "traced_peak_mb": round(traced_peak / 2**20, 2),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "index_mb": round(store.index.ntotal * store.index.d * 4 / 2**20, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="10,100,400")
+    parser.add_argument("--modes", default="whole,streaming")
+    parser.add_argument("--fake", action="store_true", help="use FakeEmbeddings to isolate parsing memory")
+    parser.add_argument("--corpus-dir", default="bench_data/memory")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        mode, pages = args.case.split(":")
+        print(json.dumps(run_case(mode, int(pages), args.fake, args.corpus_dir)))
+        return
+
+    results = []
+    for pages in [int(p) for p in args.pages.split(",")]:
+        for mode in args.modes.split(","):
+            cmd = [sys.executable, os.path.abspath(__file__), "--case", f"{mode}:{pages}", "--corpus-dir", args.corpus_dir]
+            if args.fake:
+                cmd.append("--fake")
+            output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Load test for AsyncOllamaClient against the fake Ollama server.
+
+Fires --requests generations with --concurrency callers at once and
+reports latency percentiles, how many were rejected with LLMBusyError
+(the 429 path) and the peak concurrency the server saw, which must not
+exceed --max-in-flight.
+
+    python benchmarks/fake_ollama.py --port 11435 &
+    python benchmarks/bench_llm_client.py --url http://127.0.0.1:11435 --concurrency 64 --max-in-flight 4 --max-queue 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from llm_client import AsyncOllamaClient, LLMBusyError, LLMTimeoutError
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else None
+
+async def run(args) -> dict:
+    client = AsyncOllamaClient(base_url=args.url, max_in_flight=args.max_in_flight,
+                               max_queue=args.max_queue, timeout=args.timeout)
+    latencies, ttfts = [], []
+    outcomes = {"ok": 0, "busy": 0, "timeout": 0, "error": 0}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                if args.stream:
+                    first = None
+                    async for _ in client.stream(f"prompt {i}"):
+                        first = first or time.perf_counter()
+                    ttfts.append(first - started)
+                else:
+                    await client.generate(f"prompt {i}")
+                latencies.append(time.perf_counter() - started)
+                outcomes["ok"] += 1
+            except LLMBusyError:
+                outcomes["busy"] += 1
+            except LLMTimeoutError:
+                outcomes["timeout"] += 1
+            except Exception:
+                outcomes["error"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+
+    async with httpx.AsyncClient() as http:
+        server = (await http.get(f"{args.url}/stats")).json()
+
+    return {
+        "config": vars(args),
+        "outcomes": outcomes,
+        "throughput_rps": round(outcomes["ok"] / elapsed, 2),
+        "latency_ms": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95), "p99": percentile(latencies, 0.99)},
+        "ttft_ms": {"p50": percentile(ttfts, 0.5), "p95": percentile(ttfts, 0.95)} if args.stream else None,
+        "server_peak_concurrency": server["peak_active"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:11435")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
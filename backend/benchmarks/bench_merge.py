@@ -0,0 +1,112 @@
+"""Upload latency as a session grows: full re-embed vs. append-only merge.
+
+Simulates uploading `--uploads` PDFs of `--chunks` chunks each into one
+session. The merge strategy times update_session_with_pdf as ingestion
+runs it (staged copy, append, reindex, swap; the write-behind save is
+queued, not timed). The rebuild strategy re-embeds every stored chunk,
+and its embedding time is reported separately: with --fake it is close
+to zero and says nothing about the real model.
+
+Runs in a scratch directory, so no data/ is touched.
+
+    python benchmarks/bench_merge.py --uploads 50 --chunks 20
+    python benchmarks/bench_merge.py --fake        # skip the real model
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+def make_docs(upload: int, chunks: int):
+    return [
+        Document(
+            page_content=f"Upload {upload} chunk {i}: " + " ".join(f"term{(upload * 31 + i * 7 + w) % 997}" for w in range(150)),
+            metadata={"source": f"doc_{upload}.pdf", "page": i // 4}
+        )
+        for i in range(chunks)
+    ]
+
+def rebuild(existing, new, embeddings):
+    """Old behaviour: pull every document back out and re-embed the lot; returns (store, embedding seconds)"""
+    docs = list(existing.docstore._dict.values()) + list(new.docstore._dict.values())
+    texts = [doc.page_content for doc in docs]
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    embed_seconds = time.perf_counter() - started
+    store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=[doc.metadata for doc in docs])
+    return store, embed_seconds
+
+def run(strategy: str, uploads: int, chunks: int, embeddings):
+    # Imported only once main() is in the scratch directory
+    import session_manager
+    session_id = f"bench-{strategy}"
+    store = None
+    timings, embed_timings = [], []
+    for n in range(1, uploads + 1):
+        # Embedding the new PDF itself is identical for both strategies, so it is not timed
+        new_store = FAISS.from_documents(make_docs(n, chunks), embeddings)
+        start = time.perf_counter()
+        if strategy == "rebuild":
+            if store is None:
+                store, embed_seconds = new_store, 0.0
+            else:
+                store, embed_seconds = rebuild(store, new_store, embeddings)
+            embed_timings.append(embed_seconds)
+        else:
+            session_manager.update_session_with_pdf(session_id, new_store, f"doc_{n}.pdf")
+        timings.append(time.perf_counter() - start)
+    if strategy != "rebuild":
+        store = session_manager.get_vector_store(session_manager.get_session(session_id))
+    return timings, embed_timings, store.index.ntotal
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per uploaded PDF")
+    parser.add_argument("--strategies", default="merge,rebuild")
+    parser.add_argument("--fake", action="store_true", help="use FakeEmbeddings instead of the real model")
+    args = parser.parse_args()
+
+    # Backend modules create logs/ and data/ in the working directory on import
+    workdir = tempfile.mkdtemp(prefix="bench_merge_")
+    os.chdir(workdir)
+    import embeddings as embeddings_module
+    if args.fake:
+        embeddings_module._embeddings = FakeEmbeddings(size=384)
+    embeddings = embeddings_module.get_embeddings()
+
+    results = {}
+    try:
+        for strategy in args.strategies.split(","):
+            timings, embed_timings, total = run(strategy, args.uploads, args.chunks, embeddings)
+            results[strategy] = {
+                "total_vectors": total,
+                "first_upload_ms": round(timings[1] * 1000, 2) if len(timings) > 1 else None,
+                "last_upload_ms": round(timings[-1] * 1000, 2),
+                "per_upload_ms": [round(t * 1000, 2) for t in timings]
+            }
+            if embed_timings:
+                results[strategy]["embedding_ms"] = [round(t * 1000, 2) for t in embed_timings]
+            print(f"{strategy:>8}: upload 2 {results[strategy]['first_upload_ms']} ms -> "
+                  f"upload {args.uploads} {results[strategy]['last_upload_ms']} ms ({total} vectors)")
+        if args.fake and "rebuild" in results:
+            print("note: --fake embeds at no cost, so rebuild's embedding_ms is not representative")
+    finally:
+        import session_manager
+        session_manager.shutdown()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
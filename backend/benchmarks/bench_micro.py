@@ -0,0 +1,163 @@
+"""Micro-benchmarks for the ingestion and persistence hot paths.
+
+  * process_pdf: PDFProcessor.process_pdf on synthetic PDFs of each
+    --pages size, with the embedding cache off so every run embeds
+  * merge: update_session_with_pdf into one session over --uploads PDFs
+    of --chunks chunks, reporting how merge latency changes as it grows
+  * storage: save_session (full and one-message incremental),
+    load_session and load_vectors for each storage backend at each
+    --history length
+
+Everything runs in a scratch directory, so no data/ or uploads/ is
+touched. --fake swaps in FakeEmbeddings to time everything but the model.
+
+    python benchmarks/bench_micro.py --fake --output bench_results/micro.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_report import emit, metadata, summarize
+from synthetic_pdf import write_corpus
+
+def timed_ms(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+def make_docs(upload: int, chunks: int):
+    from langchain.docstore.document import Document
+    return [
+        Document(
+            page_content=f"Upload {upload} chunk {i}: " + " ".join(f"term{(upload * 31 + i * 7 + w) % 997}" for w in range(150)),
+            metadata={"source": f"doc_{upload}.pdf", "page": i // 4}
+        )
+        for i in range(chunks)
+    ]
+
+def bench_process_pdf(args, workdir: str) -> list:
+    from pdf_processor import PDFProcessor
+    processor = PDFProcessor()
+    results = []
+    for pages in [int(p) for p in args.pages.split(",")]:
+        source = write_corpus(f"{workdir}/corpus", 1, pages)[0]
+        samples, chunks = [], 0
+        for run in range(args.repeat):
+            # process_pdf deletes its input, as it does with uploads
+            copy = f"{source}.{run}.pdf"
+            shutil.copyfile(source, copy)
+            started = time.perf_counter()
+            store = processor.process_pdf(copy)
+            samples.append((time.perf_counter() - started) * 1000)
+            chunks = store.index.ntotal
+        results.append({"pages": pages, "bytes": os.path.getsize(source), "chunks": chunks, **summarize(samples)})
+    return results
+
+def bench_merge(args, embeddings) -> dict:
+    from langchain_community.vectorstores import FAISS
+    import session_manager
+
+    session_id = "bench-merge"
+    session_manager.create_session(session_id, None, "General Chat")
+    samples = []
+    for upload in range(1, args.uploads + 1):
+        # Embedding the upload is process_pdf's cost, not the merge's
+        store = FAISS.from_documents(make_docs(upload, args.chunks), embeddings)
+        samples.append(timed_ms(lambda: session_manager.update_session_with_pdf(session_id, store, f"doc_{upload}.pdf")))
+    total = session_manager.get_vector_store(session_manager.get_session(session_id)).index.ntotal
+    session_manager.shutdown()
+    tenth = max(1, len(samples) // 10)
+    return {
+        "uploads": args.uploads,
+        "chunks_per_upload": args.chunks,
+        "total_vectors": total,
+        # Merges into an empty session just adopt the store; growth shows in the later ones
+        "first_tenth": summarize(samples[1:1 + tenth]),
+        "last_tenth": summarize(samples[-tenth:]),
+        "all": summarize(samples[1:])
+    }
+
+def bench_storage(args, workdir: str, embeddings) -> dict:
+    from langchain_community.vectorstores import FAISS
+    from persistent_storage import create_storage
+
+    store = FAISS.from_documents(make_docs(0, args.chunks), embeddings)
+    results = {}
+    for backend in args.backends.split(","):
+        storage = create_storage(backend, storage_dir=f"{workdir}/storage_{backend}")
+        for history in [int(h) for h in args.history.split(",")]:
+            now = time.time()
+            messages = [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "lorem ipsum " * 20, "timestamp": now}
+                for i in range(history)
+            ]
+            full, incremental, load, load_vectors = [], [], [], []
+            for run in range(args.repeat):
+                session_id = f"bench-{backend}-{history}-{run}"
+                session = {
+                    "session_id": session_id, "filename": "doc.pdf", "chat_history": list(messages),
+                    "created_at": now, "last_activity": now, "vector_store": store,
+                    "profile": {"name": "Bench"}, "summary": None
+                }
+                full.append(timed_ms(lambda: storage.save_session(session_id, session)))
+                session["chat_history"].append({"role": "user", "content": "one more", "timestamp": now})
+                incremental.append(timed_ms(lambda: storage.save_session(session_id, session, save_vectors=False)))
+                load.append(timed_ms(lambda: storage.load_session(session_id)))
+                load_vectors.append(timed_ms(lambda: storage.load_vectors(session_id)))
+            results[f"{backend}/{history}_messages"] = {
+                "save_full": summarize(full),
+                "save_incremental": summarize(incremental),
+                "load_session": summarize(load),
+                "load_vectors": summarize(load_vectors)
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmarks", default="process_pdf,merge,storage")
+    parser.add_argument("--pages", default="5,20,80")
+    parser.add_argument("--uploads", type=int, default=30)
+    parser.add_argument("--chunks", type=int, default=40, help="chunks per merged upload / stored session")
+    parser.add_argument("--history", default="10,200,2000", help="chat history lengths for the storage benchmark")
+    parser.add_argument("--backends", default="file,sqlite")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fake", action="store_true", help="use FakeEmbeddings instead of the real model")
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = tempfile.mkdtemp(prefix="bench_micro_")
+    # session_manager and the storage backends use paths relative to the working directory
+    os.chdir(workdir)
+    os.environ["EMBED_CACHE"] = "0"
+
+    import embeddings as embeddings_module
+    if args.fake:
+        from langchain_community.embeddings import FakeEmbeddings
+        embeddings_module._embeddings = FakeEmbeddings(size=384)
+    embeddings = embeddings_module.get_embeddings()
+    embeddings.embed_documents(["warmup"])
+
+    selected = args.benchmarks.split(",")
+    result = {"meta": metadata(args)}
+    try:
+        if "process_pdf" in selected:
+            result["process_pdf"] = bench_process_pdf(args, workdir)
+        if "storage" in selected:
+            result["storage"] = bench_storage(args, workdir, embeddings)
+        if "merge" in selected:
+            result["merge"] = bench_merge(args, embeddings)
+    finally:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    emit(result, output)
+
+if __name__ == "__main__":
+    main()
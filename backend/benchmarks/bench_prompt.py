@@ -0,0 +1,129 @@
+"""Prompt size and time to first token: old prompt assembly vs. PromptBuilder.
+
+Builds general and document prompts for conversations of different
+lengths and message sizes, the old way (last 6 raw messages, 3 full
+chunks) and with the token-budgeted PromptBuilder, and reports the
+approximate token count of each. With --url, each prompt is also sent to
+an Ollama server (or benchmarks/fake_ollama.py with a prefill delay) and
+the time to first token is measured.
+
+    python benchmarks/fake_ollama.py --port 11435 --prefill-ms-per-1k-tokens 400 &
+    python benchmarks/bench_prompt.py --url http://127.0.0.1:11435 --budget 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import AsyncOllamaClient
+from prompt_builder import PromptBuilder, SUMMARY_KEEP_RECENT, count_tokens
+
+WORDS = ("the report shows revenue growth in the third quarter while costs for cloud storage and "
+         "support staff rose faster than planned so the team proposes new pricing tiers").split()
+
+def text(rng: random.Random, chars: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+def conversation(rng: random.Random, turns: int, message_chars: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": text(rng, message_chars)}
+        for i in range(turns)
+    ]
+
+def old_general_prompt(message: str, history):
+    """ChatHandler._handle_general_question before the prompt builder"""
+    recent_context = "\n".join(
+        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history[-6:]
+    )
+    if recent_context:
+        return f"Previous conversation:\n{recent_context}\n\nUser: {message}\n\nAssistant:"
+    return f"User: {message}\n\nAssistant:"
+
+def old_document_prompt(message: str, chunks):
+    """ChatHandler._handle_document_question before the prompt builder"""
+    context = "\n\n".join(f"Document excerpt {i+1}: {chunk}" for i, chunk in enumerate(chunks[:3]))
+    return (f"Context from report.pdf:\n{context}\n\nQuestion: {message}\n\n"
+            "Answer based on the documents (mention which document if relevant):")
+
+def build_cases(builder: PromptBuilder, seed: int):
+    rng = random.Random(seed)
+    summary = text(rng, 700)
+    chunks = [text(rng, 1000) for _ in range(3)]
+    cases = []
+    for turns in (4, 20, 100):
+        for message_chars in (100, 1500):
+            history = conversation(rng, turns, message_chars)
+            question = text(rng, min(message_chars, 400))
+            history.append({"role": "user", "content": question})
+            # Messages older than the recent window are assumed summarized
+            covered = max(0, len(history) - 1 - SUMMARY_KEEP_RECENT)
+            recent = history[covered:-1]
+            summary_text = summary if covered else ""
+            name = f"{turns}_turns_{message_chars}_chars"
+            cases.append({
+                "case": f"general/{name}",
+                "old": old_general_prompt(question, history),
+                "new": builder.general_prompt(question, recent, summary_text)
+            })
+            cases.append({
+                "case": f"document/{name}",
+                "old": old_document_prompt(question, chunks),
+                "new": builder.document_prompt(question, chunks, "report.pdf", recent, summary_text)
+            })
+    return cases
+
+async def first_token_ms(client: AsyncOllamaClient, prompt: str) -> float:
+    started = time.perf_counter()
+    tokens = client.stream(prompt)
+    try:
+        async for _ in tokens:
+            return round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        await tokens.aclose()
+
+async def measure_latency(url: str, cases, repeat: int):
+    client = AsyncOllamaClient(base_url=url, max_in_flight=1)
+    try:
+        for case in cases:
+            for variant in ("old", "new"):
+                samples = [await first_token_ms(client, case[variant]) for _ in range(repeat)]
+                case[f"{variant}_ttft_ms"] = sorted(samples)[len(samples) // 2]
+    finally:
+        await client.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, help="token budget (default PROMPT_TOKEN_BUDGET)")
+    parser.add_argument("--url", help="Ollama (or fake_ollama) base URL; omit to report token counts only")
+    parser.add_argument("--repeat", type=int, default=3, help="requests per prompt, median reported")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    builder = PromptBuilder(args.budget) if args.budget else PromptBuilder()
+    cases = build_cases(builder, args.seed)
+    if args.url:
+        asyncio.run(measure_latency(args.url, cases, args.repeat))
+
+    results = {"budget": builder.budget, "cases": []}
+    for case in cases:
+        row = {"case": case["case"], "old_tokens": count_tokens(case["old"]), "new_tokens": count_tokens(case["new"])}
+        row.update({k: v for k, v in case.items() if k.endswith("_ttft_ms")})
+        results["cases"].append(row)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Shared result helpers for the benchmark suite: latency summaries and run metadata.
+
+Every suite script emits one JSON document with a "meta" block, so two
+runs can be diffed with compare_results.py.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+def summarize(samples_ms: List[float]) -> dict:
+    """Count, mean and p50/p95/p99/max of latency samples in milliseconds"""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": pick(0.5),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata(args) -> dict:
+    """Where and how a run was made: commit, machine and the arguments used"""
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "argv": sys.argv[1:],
+        "args": vars(args)
+    }
+
+def emit(result: dict, output: Optional[str] = None):
+    """Print the result JSON and write it to output if given"""
+    text = json.dumps(result, indent=2)
+    print(text)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            f.write(text)
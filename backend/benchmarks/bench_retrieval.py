@@ -0,0 +1,111 @@
+"""Retrieval quality and added latency: vector-only vs. hybrid BM25 + RRF vs. reranked.
+
+retrieval_labels.json holds chunks from a contract, a pump manual, project
+notes and a handbook, with questions labelled by the chunk(s) that answer
+them. "exact" questions hinge on identifiers (part numbers, clause IDs,
+names); "paraphrase" questions share little vocabulary with their chunk.
+
+For each mode it reports hit@3 (the chunks that reach the prompt),
+recall@4, MRR@10 and per-question retrieval latency, excluding the query
+embedding, which every mode shares. --distractors pads the store with
+generated chunks to see how latency scales.
+
+    python benchmarks/bench_retrieval.py --reranker cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from embeddings import get_embeddings
+from faiss_store import index_new_chunks
+from hybrid_retriever import HybridRetriever
+
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_labels.json")
+
+def distractor_chunks(chunks, count: int, seed: int):
+    """Filler chunks made of the corpus vocabulary, so they compete with the real ones"""
+    rng = random.Random(seed)
+    words = [word for chunk in chunks for word in chunk.split()]
+    return [" ".join(rng.choice(words) for _ in range(40)) for _ in range(count)]
+
+def evaluate(retriever, vector_store, queries, query_vectors, position_of) -> dict:
+    hits3 = recall4 = reciprocal = 0.0
+    by_kind = {}
+    latencies = []
+    for example, query_vector in zip(queries, query_vectors):
+        t0 = time.perf_counter()
+        docs = retriever.retrieve(vector_store, example["query"], query_vector, k=10)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        ranked = [position_of.get(doc.page_content) for doc in docs]
+        relevant = set(example["relevant"])
+        hit = bool(relevant & set(ranked[:3]))
+        hits3 += hit
+        recall4 += len(relevant & set(ranked[:4])) / len(relevant)
+        first = next((rank for rank, position in enumerate(ranked, start=1) if position in relevant), None)
+        reciprocal += 1 / first if first else 0.0
+        kind = by_kind.setdefault(example["kind"], [0, 0])
+        kind[0] += hit
+        kind[1] += 1
+    n = len(queries)
+    latencies.sort()
+    pick = lambda q: round(latencies[min(n - 1, int(q * n))], 3)
+    return {
+        "hit@3": round(hits3 / n, 3),
+        "recall@4": round(recall4 / n, 3),
+        "mrr@10": round(reciprocal / n, 3),
+        "hit@3_by_kind": {kind: round(hit / total, 3) for kind, (hit, total) in sorted(by_kind.items())},
+        "latency_p50_ms": pick(0.5),
+        "latency_p95_ms": pick(0.95)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=LABELS_PATH)
+    parser.add_argument("--reranker", default="", help="cross-encoder model for the reranked mode; omitted skips it")
+    parser.add_argument("--rerank-candidates", type=int, default=8)
+    parser.add_argument("--candidates", type=int, default=20, help="per-ranking depth before fusion")
+    parser.add_argument("--distractors", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the questions for timing")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    chunks = labels["chunks"]
+    queries = labels["queries"] * args.repeat
+    texts = chunks + distractor_chunks(chunks, args.distractors, args.seed)
+    position_of = {text: position for position, text in enumerate(chunks)}
+
+    embeddings = get_embeddings()
+    vector_store = FAISS.from_texts(texts, embeddings)
+    index_new_chunks(vector_store, 0, texts)
+    query_vectors = [embeddings.embed_query(example["query"]) for example in labels["queries"]] * args.repeat
+
+    modes = {
+        "vector": HybridRetriever(mode="vector", reranker_model=""),
+        "hybrid": HybridRetriever(mode="hybrid", candidates=args.candidates, reranker_model="")
+    }
+    if args.reranker:
+        modes["hybrid_rerank"] = HybridRetriever(mode="hybrid", candidates=args.candidates, reranker_model=args.reranker,
+                                                 rerank_candidates=args.rerank_candidates)
+    results = {"chunks": len(texts), "questions": len(labels["queries"]), "modes": {}}
+    for name, retriever in modes.items():
+        # Load the reranker (if any) before timing
+        retriever.retrieve(vector_store, queries[0]["query"], query_vectors[0])
+        results["modes"][name] = evaluate(retriever, vector_store, queries, query_vectors, position_of)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
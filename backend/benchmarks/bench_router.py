@@ -0,0 +1,108 @@
+"""Intent routing latency and accuracy.
+
+Latency: the old per-intent `any(keyword in message)` scans against the
+compiled single-pass matcher, and the full route including the
+embedding fallback.
+
+Accuracy: routing_labels.json holds a small agreement document and
+questions labelled personal/document/general as if asked in a session
+holding that document. Accuracy is reported for keywords only (the old
+behaviour) and with the retrieval-score fallback at several thresholds.
+
+    python benchmarks/bench_router.py --thresholds 0.3,0.4,0.45,0.5,0.6
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from embeddings import get_embeddings
+from intent_router import (
+    DOCUMENT, DOCUMENT_KEYWORDS, GENERAL, PERSONAL, PERSONAL_KEYWORDS, IntentRouter, top_similarity
+)
+
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_labels.json")
+
+def keyword_scan(message: str) -> str:
+    """Old routing: one lowercase + linear scan per intent"""
+    message_lower = message.lower()
+    if any(keyword in message_lower for keyword in PERSONAL_KEYWORDS):
+        return PERSONAL
+    message_lower = message.lower()
+    if any(keyword in message_lower for keyword in DOCUMENT_KEYWORDS):
+        return DOCUMENT
+    return GENERAL
+
+def time_per_call(fn, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+def accuracy(predicted, examples) -> dict:
+    per_intent = {}
+    for intent, example in zip(predicted, examples):
+        stats = per_intent.setdefault(example["intent"], {"total": 0, "correct": 0})
+        stats["total"] += 1
+        stats["correct"] += intent == example["intent"]
+    correct = sum(s["correct"] for s in per_intent.values())
+    return {
+        "accuracy": round(correct / len(examples), 3),
+        "per_intent": {k: round(s["correct"] / s["total"], 3) for k, s in sorted(per_intent.items())}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=LABELS_PATH)
+    parser.add_argument("--thresholds", default="0.3,0.4,0.45,0.5,0.6")
+    parser.add_argument("--repeat", type=int, default=2000, help="passes over the messages for keyword timings")
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    examples = labels["examples"]
+    messages = [example["message"] for example in examples]
+
+    embeddings = get_embeddings()
+    vector_store = FAISS.from_texts(labels["document"], embeddings)
+    router = IntentRouter()
+
+    results = {"examples": len(examples), "latency_us": {}, "accuracy": {}}
+    results["latency_us"]["keyword_scan"] = round(time_per_call(keyword_scan, messages, args.repeat), 2)
+    results["latency_us"]["compiled_match"] = round(
+        time_per_call(lambda m: router.match_keywords(m) or GENERAL, messages, args.repeat), 2
+    )
+    router.route(messages[0], lambda: vector_store)  # warm up the model
+    results["latency_us"]["route_with_fallback"] = round(
+        time_per_call(lambda m: router.route(m, lambda: vector_store), messages, 3), 2
+    )
+
+    results["accuracy"]["keywords_only"] = accuracy([keyword_scan(m) for m in messages], examples)
+
+    # Keyword hits are threshold independent; score the rest once and sweep
+    keyword_intents = [router.match_keywords(m) for m in messages]
+    scores = [
+        None if intent else top_similarity(vector_store, embeddings.embed_query(m))
+        for intent, m in zip(keyword_intents, messages)
+    ]
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        predicted = [
+            intent or (DOCUMENT if score >= threshold else GENERAL)
+            for intent, score in zip(keyword_intents, scores)
+        ]
+        results["accuracy"][f"fallback@{threshold}"] = accuracy(predicted, examples)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Memory and query latency: per-session FAISS stores vs. the shared index.
+
+Builds --sessions sessions of --chunks chunks each with random vectors.
+A --shared-fraction of sessions upload one of --popular-docs common
+documents, which the shared index stores once. Each mode runs in its own
+process so the RSS growth it reports is its own:
+
+  * per_session: one in-memory FAISS store per session, as when every
+    session is resident
+  * shared: SharedVectorIndex, searched through each session's view
+  * shared_selector: the shared index with every search forced through
+    a faiss IDSelector instead of reconstructing the session's vectors
+
+    python benchmarks/bench_shared_index.py --sessions 10000 --chunks 40
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+MODES = ("per_session", "shared", "shared_selector")
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def session_chunks(args, session: int):
+    """(content, vector) pairs for one session; popular documents repeat across sessions"""
+    pick = random.Random(session)
+    if pick.random() < args.shared_fraction:
+        doc = f"popular{pick.randrange(args.popular_docs)}"
+    else:
+        doc = f"private{session}"
+    doc_rng = np.random.default_rng(zlib.crc32(doc.encode()))
+    vectors = doc_rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    filler = "x" * max(0, args.chunk_chars - 40)
+    return [(f"{doc} chunk {i} {filler}", vectors[i]) for i in range(args.chunks)]
+
+def build_per_session(args):
+    import faiss
+    from langchain.docstore.document import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    stores = {}
+    for session in range(args.sessions):
+        chunks = session_chunks(args, session)
+        index = faiss.IndexFlatL2(args.dim)
+        index.add(np.stack([vector for _, vector in chunks]))
+        ids = [f"{session}-{i}" for i in range(len(chunks))]
+        docstore = InMemoryDocstore({doc_id: Document(page_content=text, metadata={"source": "doc.pdf"})
+                                     for doc_id, (text, _) in zip(ids, chunks)})
+        stores[session] = FAISS(lambda text: None, index, docstore, dict(enumerate(ids)))
+    return lambda session, query: stores[session].similarity_search_by_vector(query, k=4)
+
+def build_shared(args, workdir: str):
+    import shared_index
+    from langchain.docstore.document import Document
+    from faiss_store import chunk_hash
+
+    if args.mode == "shared_selector":
+        shared_index.VECTOR_SELECTOR_MIN_IDS = 0
+    index = shared_index.SharedVectorIndex(f"{workdir}/shared", shards=args.shards)
+    for session in range(args.sessions):
+        entries = []
+        for text, vector in session_chunks(args, session):
+            doc = Document(page_content=text, metadata={"source": "doc.pdf"})
+            entries.append((chunk_hash(doc), doc, vector))
+        index.add(str(session), entries)
+    views = {}
+
+    def search(session, query):
+        view = views.get(session) or views.setdefault(session, index.view(str(session)))
+        return view.similarity_search_by_vector(query, k=4)
+    return search
+
+def run_mode(args) -> dict:
+    baseline = rss_mb()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        search = build_per_session(args) if args.mode == "per_session" else build_shared(args, workdir)
+        build_seconds = time.perf_counter() - started
+        memory = rss_mb() - baseline
+
+        rng = np.random.default_rng(args.seed)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        sessions = rng.integers(0, args.sessions, args.queries)
+        search(int(sessions[0]), queries[0])
+        latencies = []
+        for session, query in zip(sessions, queries):
+            t0 = time.perf_counter()
+            search(int(session), query)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+    return {
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "chunks_per_session": args.chunks,
+        "build_seconds": round(build_seconds, 1),
+        "rss_growth_mb": round(memory, 1),
+        "query_p50_ms": pick(0.5),
+        "query_p95_ms": pick(0.95),
+        "query_p99_ms": pick(0.99)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--shared-fraction", type=float, default=0.3)
+    parser.add_argument("--popular-docs", type=int, default=50)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mode", choices=MODES, help="run a single mode in this process")
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    results = []
+    forwarded = []
+    for name in ("sessions", "chunks", "dim", "chunk_chars", "shared_fraction", "popular_docs", "shards", "queries", "seed"):
+        forwarded += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    for mode in MODES:
+        out = subprocess.run([sys.executable, __file__, "--mode", mode, *forwarded],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    output = json.dumps({"runs": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare two benchmark result files and flag regressions.
+
+Walks both JSON documents (skipping "meta"), pairs up numeric values by
+path and reports the relative change. Latencies (*_ms, *_s, *_seconds)
+regress when they grow; throughput, hit rates and recall regress when
+they shrink. Anything beyond --threshold is listed as a regression and
+the exit status is 1, so the comparison can gate a deploy.
+
+    python benchmarks/compare_results.py bench_results/base.json bench_results/new.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("throughput", "hit_rate", "hit@", "recall", "mrr", "accuracy")
+LOWER_IS_BETTER = ("_ms", "_s", "_seconds", "_mb", "bytes")
+
+def flatten(value, path: str = ""):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == "meta":
+                continue
+            yield from flatten(child, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for i, child in enumerate(value):
+            yield from flatten(child, f"{path}[{i}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, value
+
+def direction(path: str) -> int:
+    """+1 if bigger is better, -1 if smaller is better, 0 if unknown"""
+    leaf = path.rsplit(".", 1)[-1]
+    if any(marker in leaf for marker in HIGHER_IS_BETTER):
+        return 1
+    if any(leaf.endswith(marker) for marker in LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def compare(base: dict, new: dict, threshold: float) -> dict:
+    base_values = dict(flatten(base))
+    changes, regressions = [], []
+    for path, value in flatten(new):
+        if path not in base_values:
+            continue
+        before = base_values[path]
+        change = (value - before) / before if before else (0.0 if value == before else float("inf"))
+        entry = {"path": path, "base": before, "new": value, "change": round(change, 4)}
+        changes.append(entry)
+        sign = direction(path)
+        if sign and -sign * change > threshold:
+            regressions.append(entry)
+    return {"threshold": threshold, "compared": len(changes), "regressions": regressions, "changes": changes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    parser.add_argument("--all", action="store_true", help="include unchanged and unflagged values in the output")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    result = compare(base, new, args.threshold)
+    if not args.all:
+        result["changes"] = [c for c in result["changes"] if abs(c["change"]) > args.threshold]
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["regressions"] else 0)
+
+if __name__ == "__main__":
+    main()
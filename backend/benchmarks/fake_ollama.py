@@ -0,0 +1,85 @@
+"""Stub server that mimics Ollama's /api/generate for load tests.
+
+Replies with a fixed number of tokens, sleeping between them to imitate
+generation speed, in both streaming (NDJSON) and non-streaming modes.
+--prefill-ms-per-1k-tokens adds a delay proportional to prompt length
+(about 4 characters per token) before the first token, like prompt
+evaluation on a real model.
+Point the backend at it with OLLAMA_BASE_URL=http://127.0.0.1:11435.
+
+    python benchmarks/fake_ollama.py --port 11435 --tokens 50 --token-latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+def create_app(tokens: int = 50, token_latency_ms: float = 20, first_token_ms: float = 100,
+               prefill_ms_per_1k_tokens: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.active = 0
+    app.state.peak_active = 0
+    app.state.requests = 0
+
+    def words():
+        return [f"token{i} " for i in range(tokens)]
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        app.state.active += 1
+        app.state.peak_active = max(app.state.peak_active, app.state.active)
+        started = time.time()
+        first_token_delay = first_token_ms + prefill_ms_per_1k_tokens * len(body.get("prompt", "")) / 4000
+
+        def chunk(text: str, done: bool) -> dict:
+            return {"model": body.get("model", "mistral"), "created_at": started, "response": text, "done": done}
+
+        if not body.get("stream", True):
+            try:
+                await asyncio.sleep((first_token_delay + token_latency_ms * tokens) / 1000)
+                return chunk("".join(words()), True)
+            finally:
+                app.state.active -= 1
+
+        async def ndjson():
+            try:
+                await asyncio.sleep(first_token_delay / 1000)
+                for word in words():
+                    yield json.dumps(chunk(word, False)) + "\n"
+                    await asyncio.sleep(token_latency_ms / 1000)
+                yield json.dumps(chunk("", True)) + "\n"
+            finally:
+                # Also runs when the client disconnects mid-stream
+                app.state.active -= 1
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "mistral:latest"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "active": app.state.active, "peak_active": app.state.peak_active}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=100)
+    parser.add_argument("--prefill-ms-per-1k-tokens", type=float, default=0)
+    args = parser.parse_args()
+    app = create_app(args.tokens, args.token_latency_ms, args.first_token_ms, args.prefill_ms_per_1k_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Import-time profile of the backend, to keep server startup fast.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter
+(from a scratch directory, so no data/ is touched) --repeat times and
+reports the median total import time, the slowest modules by cumulative
+and self time, and any --forbid module that got imported. Heavy
+dependencies are meant to load on first use or in the background warmup,
+not when main is imported.
+
+Exits 1 if a forbidden module was imported or the median exceeds
+--budget-ms, so it can run as a CI check; the JSON output can also be
+diffed with compare_results.py.
+
+    python benchmarks/import_profile.py --budget-ms 1500 --output bench_results/imports.json
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_report import emit, metadata
+
+# Loaded on first use (see warmup.DEFERRED_IMPORTS); importing main must not pull them in
+DEFAULT_FORBIDDEN = (
+    "torch,sentence_transformers,transformers,langchain_community.document_loaders,"
+    "langchain_community.embeddings,langchain_community.vectorstores,langchain.text_splitter,pypdf,httpx"
+)
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def profile_once(module: str, workdir: str) -> list:
+    """(module, self_us, cumulative_us, depth) for every import, in import order"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=workdir, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--forbid", default=DEFAULT_FORBIDDEN, help="comma-separated modules that must not be imported")
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail if the median import exceeds this; 0 disables")
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="import_profile_")
+    try:
+        runs = [profile_once(args.module, workdir) for _ in range(args.repeat)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    totals = [next(cumulative for name, _, cumulative, _ in rows if name == args.module) / 1000 for rows in runs]
+    # The run closest to the median stands in for the per-module breakdown
+    median_ms = statistics.median(totals)
+    rows = runs[min(range(len(runs)), key=lambda i: abs(totals[i] - median_ms))]
+    top_level = [(name, cumulative) for name, _, cumulative, depth in rows if depth == 1]
+
+    imported = {name for name, _, _, _ in rows}
+    forbidden = [name for name in args.forbid.split(",") if name and name in imported]
+    result = {
+        "meta": metadata(args),
+        "module": args.module,
+        "import_ms": round(median_ms, 1),
+        "import_runs_ms": [round(total, 1) for total in totals],
+        "modules_imported": len(imported),
+        "forbidden_imported": forbidden,
+        "budget_ms": args.budget_ms or None,
+        "top_level_cumulative_ms": {
+            name: round(cumulative / 1000, 1) for name, cumulative in sorted(top_level, key=lambda r: -r[1])[:args.top]
+        },
+        "slowest_self_ms": {
+            name: round(self_us / 1000, 1) for name, self_us, _, _ in sorted(rows, key=lambda r: -r[1])[:args.top]
+        }
+    }
+    emit(result, args.output)
+    if forbidden or (args.budget_ms and median_ms > args.budget_ms):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
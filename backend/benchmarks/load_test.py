@@ -0,0 +1,255 @@
+"""Concurrent load driver for mixed upload/chat traffic against the HTTP API.
+
+--concurrency virtual users share a pool of --sessions sessions. Each
+request is an upload with probability --upload-ratio (a synthetic PDF
+of --pages pages, then polling /ingest/{job_id} until it finishes),
+otherwise a chat message drawn from document, general and personal
+questions (--stream uses /chat/stream and also records time to first
+token). The run ends after --requests requests or --duration seconds.
+
+Reported per operation (upload accept, ingest to completion, chat,
+chat TTFT): p50/p95/p99 latency, errors by status, and throughput.
+
+Against a running server:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 16 --duration 60
+
+Or self-contained: start the fake Ollama server and the backend (in a
+scratch directory, optionally with FakeEmbeddings) and tear both down:
+
+    python benchmarks/load_test.py --spawn --fake --concurrency 16 --requests 500 --output bench_results/load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx
+from bench_report import emit, metadata, summarize
+from synthetic_pdf import build_pdf
+
+QUESTIONS = {
+    "document": [
+        "What does the document say about warranty and liability?",
+        "Summarize the maintenance procedure in the document",
+        "What are the payment terms in the contract?",
+        "Which section covers sensor calibration?"
+    ],
+    "general": [
+        "Tell me a fun fact about octopuses",
+        "How do I write a good status report?",
+        "Explain what a vector database is"
+    ],
+    "personal": [
+        "My name is Sam and I work as an engineer",
+        "What is my name?"
+    ]
+}
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.completed = 0
+
+    def ok(self, op: str, seconds: float):
+        self.samples.setdefault(op, []).append(seconds * 1000)
+
+    def error(self, op: str, reason):
+        errors = self.errors.setdefault(op, {})
+        errors[str(reason)] = errors.get(str(reason), 0) + 1
+
+async def upload(client: httpx.AsyncClient, args, session_id: str, pdf: bytes, recorder: Recorder):
+    started = time.perf_counter()
+    response = await client.post(
+        "/upload-pdf", files={"file": ("load.pdf", pdf, "application/pdf")}, data={"session_id": session_id}
+    )
+    if response.status_code != 200:
+        recorder.error("upload", response.status_code)
+        return
+    recorder.ok("upload", time.perf_counter() - started)
+    job_id = response.json()["job_id"]
+    deadline = time.monotonic() + args.ingest_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(args.poll_interval)
+        job = (await client.get(f"/ingest/{job_id}")).json()
+        if job.get("status") == "done":
+            recorder.ok("ingest", time.perf_counter() - started)
+            return
+        if job.get("status") == "failed":
+            recorder.error("ingest", "failed")
+            return
+    recorder.error("ingest", "timeout")
+
+async def chat(client: httpx.AsyncClient, args, session_id: str, message: str, recorder: Recorder):
+    started = time.perf_counter()
+    body = {"message": message, "session_id": session_id}
+    if not args.stream:
+        response = await client.post("/chat", json=body)
+        if response.status_code == 200:
+            recorder.ok("chat", time.perf_counter() - started)
+        else:
+            recorder.error("chat", response.status_code)
+        return
+    async with client.stream("POST", "/chat/stream", json=body) as response:
+        if response.status_code != 200:
+            recorder.error("chat", response.status_code)
+            return
+        first = True
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if "error" in event:
+                recorder.error("chat", "stream_error")
+                return
+            if first and "token" in event:
+                recorder.ok("chat_ttft", time.perf_counter() - started)
+                first = False
+    recorder.ok("chat", time.perf_counter() - started)
+
+async def virtual_user(client, args, rng: random.Random, sessions, pdfs, recorder: Recorder, budget, stop_at: float):
+    while time.monotonic() < stop_at and budget():
+        session_id = rng.choice(sessions)
+        try:
+            if rng.random() < args.upload_ratio:
+                await upload(client, args, session_id, rng.choice(pdfs), recorder)
+            else:
+                kind = rng.choices(list(QUESTIONS), weights=[0.5, 0.35, 0.15])[0]
+                await chat(client, args, session_id, rng.choice(QUESTIONS[kind]), recorder)
+        except httpx.HTTPError as e:
+            recorder.error("transport", type(e).__name__)
+        recorder.completed += 1
+
+async def run(args, url: str) -> dict:
+    rng = random.Random(args.seed)
+    sessions = [f"load-{args.seed}-{i}" for i in range(args.sessions)]
+    pdfs = [build_pdf(args.pages, doc_id=f"L{i}", seed=args.seed) for i in range(args.distinct_pdfs)]
+    recorder = Recorder()
+    issued = 0
+
+    def budget() -> bool:
+        nonlocal issued
+        if args.requests and issued >= args.requests:
+            return False
+        issued += 1
+        return True
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        stop_at = time.monotonic() + (args.duration or float("inf"))
+        await asyncio.gather(*[
+            virtual_user(client, args, random.Random(rng.random()), sessions, pdfs, recorder, budget, stop_at)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    operations = {}
+    for op in sorted(set(recorder.samples) | set(recorder.errors)):
+        samples = recorder.samples.get(op, [])
+        operations[op] = {
+            **summarize(samples),
+            "errors": recorder.errors.get(op, {}),
+            "throughput_per_s": round(len(samples) / elapsed, 2)
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": recorder.completed,
+        "throughput_per_s": round(recorder.completed / elapsed, 2),
+        "operations": operations
+    }
+
+def serve_backend(port: int, fake: bool):
+    """Run the backend in this process (used as the --serve-backend child)"""
+    import uvicorn
+    if fake:
+        import embeddings
+        from langchain_community.embeddings import FakeEmbeddings
+        embeddings._embeddings = FakeEmbeddings(size=384)
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+def wait_until_up(url: str, path: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}{path}", timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="total requests; 0 runs for --duration")
+    parser.add_argument("--duration", type=float, default=0, help="seconds; 0 runs until --requests")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--upload-ratio", type=float, default=0.1)
+    parser.add_argument("--pages", type=int, default=10, help="pages per uploaded PDF")
+    parser.add_argument("--distinct-pdfs", type=int, default=4, help="different PDFs to upload (repeats hit the embedding cache)")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and record time to first token")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--ingest-timeout", type=float, default=300)
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--spawn", action="store_true", help="start fake Ollama and the backend for the run")
+    parser.add_argument("--fake", action="store_true", help="with --spawn, use FakeEmbeddings in the backend")
+    parser.add_argument("--backend-port", type=int, default=8010)
+    parser.add_argument("--ollama-port", type=int, default=11437)
+    parser.add_argument("--token-latency-ms", type=float, default=20, help="fake Ollama per-token delay")
+    parser.add_argument("--tokens", type=int, default=50, help="fake Ollama tokens per reply")
+    parser.add_argument("--serve-backend", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write results JSON here as well as stdout")
+    args = parser.parse_args()
+
+    if args.serve_backend:
+        serve_backend(args.backend_port, args.fake)
+        return
+    if not args.requests and not args.duration:
+        parser.error("set --requests or --duration")
+
+    children = []
+    workdir = None
+    url = args.url
+    try:
+        if args.spawn:
+            workdir = tempfile.mkdtemp(prefix="load_test_")
+            env = {**os.environ, "OLLAMA_BASE_URL": f"http://127.0.0.1:{args.ollama_port}"}
+            children.append(subprocess.Popen([
+                sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"), "--port", str(args.ollama_port),
+                "--tokens", str(args.tokens), "--token-latency-ms", str(args.token_latency_ms)
+            ]))
+            backend = [sys.executable, os.path.abspath(__file__), "--serve-backend", "--backend-port", str(args.backend_port)]
+            # The backend keeps data/, uploads/ and logs/ relative to its working directory
+            children.append(subprocess.Popen(backend + (["--fake"] if args.fake else []), cwd=workdir, env={
+                **env, "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+            }))
+            url = f"http://127.0.0.1:{args.backend_port}"
+            wait_until_up(f"http://127.0.0.1:{args.ollama_port}", "/api/tags")
+            wait_until_up(url, "/ready")
+        result = {"meta": metadata(args), "url": url, **asyncio.run(run(args, url))}
+    finally:
+        for child in reversed(children):
+            child.terminate()
+            child.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    emit(result, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Deterministic synthetic PDFs for benchmarks.
+
+Writes plain-text PDFs without any third-party dependency so benchmark
+corpora can be regenerated byte-for-byte on any machine.
+
+    python benchmarks/synthetic_pdf.py --out bench_data/corpus --count 5 --pages 20
+    python benchmarks/synthetic_pdf.py --out bench_data/large --count 1 --size-mb 5
+"""
+import argparse
+import os
+import random
+
+WORDS = (
+    "agreement clause section party payment invoice delivery warranty liability term "
+    "notice schedule report revenue quarter forecast component assembly torque voltage "
+    "sensor calibration maintenance inspection procedure safety compliance audit policy "
+    "employee training budget contract supplier shipment inventory order customer account"
+).split()
+
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def page_lines(rng: random.Random, page_number: int, doc_id: str):
+    lines = [f"Document {doc_id} page {page_number}"]
+    for line_number in range(LINES_PER_PAGE - 1):
+        words = [rng.choice(WORDS) for _ in range(WORDS_PER_LINE)]
+        if line_number % 9 == 0:
+            # Exact identifiers give keyword retrieval something to find
+            words.append(f"ID-{doc_id}-{page_number:03d}-{line_number:02d}")
+        lines.append(" ".join(words))
+    return lines
+
+def build_pdf(pages, doc_id: str = "A", seed: int = 0) -> bytes:
+    """Return the bytes of a PDF with the given number of text pages"""
+    rng = random.Random(f"{doc_id}:{seed}")
+    objects = []  # object bodies, numbered from 1
+
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for number in range(1, pages + 1):
+        text_ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in page_lines(rng, number, doc_id):
+            text_ops.append(f"({_escape(line)}) Tj T*")
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        content_id = len(objects) + 2
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(out)
+
+def pages_for_size(size_bytes: int) -> int:
+    """Page count whose PDF comes out at roughly size_bytes"""
+    per_page = len(build_pdf(2)) - len(build_pdf(1))
+    return max(1, round(size_bytes / per_page))
+
+def write_corpus(out_dir: str, count: int, pages: int, seed: int = 0):
+    """Write count PDFs of the given page count; returns their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        doc_id = chr(ord("A") + i % 26) + (str(i // 26) if i >= 26 else "")
+        path = os.path.join(out_dir, f"synthetic_{doc_id}_{pages}p.pdf")
+        with open(path, "wb") as f:
+            f.write(build_pdf(pages, doc_id, seed))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark PDFs")
+    parser.add_argument("--out", default="bench_data/corpus")
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, help="approximate size per PDF; overrides --pages")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    pages = pages_for_size(int(args.size_mb * 1024 * 1024)) if args.size_mb else args.pages
+    for path in write_corpus(args.out, args.count, pages, args.seed):
+        print(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Keeps identifiers such as "AB-1234", "4.2.1" or "part_no" together as one token
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by does for from how i in is it its me my of on or that the this to was "
+    "what when where which who why with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers also yield their parts"""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-_./]", token) if part not in _STOPWORDS)
+    return terms
+
+class BM25Index:
+    """Inverted index over chunk text, scored with Okapi BM25.
+
+    Keys are whatever identifies a chunk in its vector store (the FAISS
+    position, or the vector id in the shared index). Chunks are added as
+    they are ingested; nothing is ever re-tokenized.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, items: Iterable[Tuple[int, str]]):
+        """Index (key, text) pairs; a key already present is replaced"""
+        with self._lock:
+            for key, text in items:
+                if key in self.lengths:
+                    self._remove(key)
+                terms = tokenize(text)
+                counts = {}
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, count in counts.items():
+                    self.postings.setdefault(term, {})[key] = count
+                self.lengths[key] = len(terms)
+                self.total_length += len(terms)
+
+    def _remove(self, key: int):
+        # Keys only map to their terms through the postings, so this scans them; re-adds are rare
+        for term in [term for term, postings in self.postings.items() if key in postings]:
+            del self.postings[term][key]
+            if not self.postings[term]:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(key)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """(key, score) of the k best matching chunks, best first"""
+        with self._lock:
+            if not self.lengths:
+                return []
+            n = len(self.lengths)
+            average_length = self.total_length / n or 1.0
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / average_length)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        """Write the index as JSON, replacing path atomically"""
+        with self._lock:
+            data = {
+                "postings": {term: list(postings.items()) for term, postings in self.postings.items()},
+                "lengths": list(self.lengths.items())
+            }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        index.postings = {term: dict(postings) for term, postings in data["postings"].items()}
+        index.lengths = dict(data["lengths"])
+        index.total_length = sum(index.lengths.values())
+        return index
@@ -1,25 +1,188 @@
-from langchain_community.llms import Ollama
+from llm_client import AsyncOllamaClient
+from response_cache import SemanticResponseCache, answer_key, document_fingerprint
+from embeddings import get_embeddings
+from intent_router import IntentRouter, PERSONAL, DOCUMENT
+from hybrid_retriever import HybridRetriever
+import time
 import session_manager
-import re
+from user_profile import describe_profile
+from prompt_builder import PromptBuilder, SUMMARY_BATCH, SUMMARY_KEEP_RECENT
 from logger import chat_logger
+from metrics import observe_stage, span
+import asyncio
+
+# Rolling window of time-to-first-token samples for streamed replies
+TTFT_WINDOW = 1000
 
 class ChatHandler:
     def __init__(self):
-        self.llm = Ollama(model="mistral", temperature=0.7)
+        self.llm = AsyncOllamaClient(model="mistral", temperature=0.7)
+        self.ttft_samples = []
+        self.response_cache = SemanticResponseCache()
+        self.router = IntentRouter()
+        self.retriever = HybridRetriever()
+        self.prompts = PromptBuilder()
+        # Sessions with a summary update in progress
+        self._summarizing = set()
+        self._summary_tasks = set()
+    
+    async def handle_message(self, message: str, session_id: str) -> str:
+        reply, prompt, store, cache_key = await self._prepare(message, session_id)
+        if not store:
+            return reply
+        
+        if prompt is not None:
+            with span("llm_total"):
+                reply = await self.llm.generate(prompt)
+            if cache_key:
+                self.response_cache.put(*cache_key, reply)
+        
+        # Store assistant response
+        session = await asyncio.to_thread(self._store_reply, session_id, reply)
+        self._schedule_summary(session_id, session)
+        
+        chat_logger.info(f"Response generated for session {session_id[:8]}...")
+        return reply
+    
+    async def stream_message(self, message: str, session_id: str, is_disconnected=None):
+        """Yield the reply as the LLM produces it; the full reply is stored when the stream ends.
+
+        If the consumer stops iterating (client disconnect) or is_disconnected()
+        returns True, generation is cancelled and nothing is stored.
+        """
+        reply, prompt, store, cache_key = await self._prepare(message, session_id)
+        if prompt is None:
+            if store:
+                await asyncio.to_thread(session_manager.add_message, session_id, "assistant", reply)
+            yield reply
+            return
+        
+        started = time.perf_counter()
+        parts = []
+        tokens = self.llm.stream(prompt)
+        try:
+            async for token in tokens:
+                if not parts:
+                    self._record_ttft(time.perf_counter() - started, session_id)
+                parts.append(token)
+                yield token
+                if is_disconnected and await is_disconnected():
+                    chat_logger.info(f"Client disconnected, cancelling generation for session {session_id[:8]}...")
+                    return
+        finally:
+            # Runs on completion, errors, disconnects and generator close;
+            # closing the LLM stream drops the connection and stops generation
+            await tokens.aclose()
+        
+        observe_stage("llm_total", time.perf_counter() - started)
+        reply = "".join(parts)
+        if cache_key:
+            self.response_cache.put(*cache_key, reply)
+        session = await asyncio.to_thread(self._store_reply, session_id, reply)
+        self._schedule_summary(session_id, session)
+        chat_logger.info(f"Streamed response generated for session {session_id[:8]}... ({len(parts)} tokens)")
     
-    def handle_message(self, message: str, session_id: str) -> str:
+    def ttft_stats(self) -> dict:
+        """Time-to-first-token percentiles over recent streamed replies"""
+        samples = sorted(self.ttft_samples)
+        if not samples:
+            return {"count": 0}
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+        return {"count": len(samples), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(samples[-1] * 1000, 1)}
+    
+    def _record_ttft(self, seconds: float, session_id: str):
+        self.ttft_samples.append(seconds)
+        observe_stage("llm_ttft", seconds)
+        del self.ttft_samples[:-TTFT_WINDOW]
+        chat_logger.info(f"Time to first token {seconds * 1000:.0f} ms for session {session_id[:8]}...")
+    
+    def _store_reply(self, session_id: str, reply: str):
+        """Add the assistant's reply to the history; returns the session"""
+        session_manager.add_message(session_id, "assistant", reply)
+        return session_manager.get_session(session_id)
+    
+    def _schedule_summary(self, session_id: str, session: dict):
+        """Fold older turns into the session summary in the background once enough accumulate"""
+        if not session or session_id in self._summarizing:
+            return
+        covered = (session.get("summary") or {}).get("covered", 0)
+        if len(session["chat_history"]) - SUMMARY_KEEP_RECENT - covered < SUMMARY_BATCH:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.get_running_loop().create_task(self._update_summary(session_id))
+        # Keep a reference so the task isn't garbage collected mid-run
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+    
+    async def _update_summary(self, session_id: str):
+        try:
+            if self.llm.is_saturated():
+                # User requests come first; retry after a later reply
+                return
+            session = await asyncio.to_thread(session_manager.get_session, session_id)
+            if not session:
+                return
+            summary = session.get("summary") or {"text": "", "covered": 0}
+            upto = len(session["chat_history"]) - SUMMARY_KEEP_RECENT
+            messages = session["chat_history"][summary["covered"]:upto]
+            with span("llm_summary"):
+                text = await self.llm.generate(self.prompts.summary_prompt(summary["text"], messages))
+            await asyncio.to_thread(session_manager.set_summary, session_id, text.strip(), upto)
+            chat_logger.info(f"Summarized {len(messages)} messages for session {session_id[:8]}...")
+        except Exception as e:
+            chat_logger.warning(f"Summary update failed for session {session_id[:8]}...: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+    
+    def _conversation(self, session: dict):
+        """Recent turns not yet in the summary, plus the summary text"""
+        history = session.get("chat_history", [])
+        summary = session.get("summary") or {}
+        # The current question is already the last message in the history
+        start = max(summary.get("covered", 0), len(history) - 1 - SUMMARY_KEEP_RECENT)
+        return history[start:-1], summary.get("text", "")
+    
+    async def _prepare(self, message: str, session_id: str):
+        """Validate, store the user message and route it.
+
+        Returns (reply, prompt, store, cache_key): either a ready reply or a
+        prompt for the LLM, whether the exchange belongs in the chat history,
+        and for cacheable document answers the response cache key.
+        """
         chat_logger.info(f"Processing message from session {session_id[:8]}...")
         
         # Input validation
         if not message or not message.strip():
-            return "Please enter a valid question or message."
+            return "Please enter a valid question or message.", None, False, None
         
         if len(message.strip()) < 2:
-            return "Please enter a more detailed question."
+            return "Please enter a more detailed question.", None, False, None
         
         # Clean the message
         message = message.strip()
         
+        # Session storage may read the disk or wait on another worker's lock
+        session = await asyncio.to_thread(self._start_turn, session_id, message)
+        
+        cache_key = None
+        has_documents = session.get("vector_store") is not None or session.get("has_vector_store")
+        load_store = (lambda: session_manager.get_vector_store(session)) if has_documents else None
+        with span("route"):
+            # Embeds the message and takes the vector lock, which ingestion may hold, on a worker thread
+            route = await asyncio.to_thread(self.router.route, message, load_store, session_manager.vector_lock(session_id))
+        # Check if it's a personal info question
+        if route.intent == PERSONAL:
+            reply, prompt = self._handle_personal_question(message, session)
+        # Check if it's about uploaded document
+        elif route.intent == DOCUMENT:
+            reply, prompt, cache_key = await self._handle_document_question(message, session, route.query_vector)
+        else:
+            # General AI conversation
+            reply, prompt = self._handle_general_question(message, session)
+        return reply, prompt, True, cache_key
+    
+    def _start_turn(self, session_id: str, message: str):
+        """Store the user message, creating the session if needed; returns the session"""
         # Get or create session (works without PDF too)
         session = session_manager.get_session(session_id)
         if not session:
@@ -28,130 +191,98 @@ class ChatHandler:
         
         # Store user message
         session_manager.add_message(session_id, "user", message)
-        
-        # Check if it's a personal info question
-        if self._is_personal_question(message):
-            response = self._handle_personal_question(message, session)
-        # Check if it's about uploaded document
-        elif session.get("vector_store") and self._is_document_question(message):
-            response = self._handle_document_question(message, session)
-        else:
-            # General AI conversation
-            response = self._handle_general_question(message, session)
-        
-        # Store assistant response
-        session_manager.add_message(session_id, "assistant", response)
-        
-        chat_logger.info(f"Response generated for session {session_id[:8]}...")
-        return response
-    
-    def _is_personal_question(self, message: str) -> bool:
-        """Check if user is asking about personal information"""
-        personal_keywords = [
-            "my name", "what is my", "who am i", "remember", "i told you",
-            "what did i say", "do you know my", "about me", "my age",
-            "my job", "my work", "my hobby", "my favorite", "where do i"
-        ]
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in personal_keywords)
-    
-    def _is_document_question(self, message: str) -> bool:
-        """Check if question is about the uploaded document"""
-        doc_keywords = [
-            "document", "pdf", "file", "text", "according to", "based on",
-            "in the document", "what does it say", "from the file"
-        ]
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in doc_keywords)
+        return session
     
-    def _handle_personal_question(self, message: str, session: dict) -> str:
-        """Handle questions about personal information"""
+    def _handle_personal_question(self, message: str, session: dict):
+        """Handle questions about personal information; returns (reply, prompt)"""
         message_lower = message.lower()
         
-        # Search chat history for relevant personal info
-        chat_history = session.get("chat_history", [])
+        # Facts are extracted as messages arrive (see session_manager.add_message)
+        profile = session.get("profile") or {}
         
         # Look for specific information
         if "name" in message_lower:
-            for msg in reversed(chat_history):
-                if msg["role"] == "user":
-                    content = msg["content"].lower()
-                    if "my name is" in content or "i am" in content:
-                        # Extract name
-                        if "my name is" in content:
-                            name = content.split("my name is")[1].strip().split()[0]
-                        else:
-                            name = content.split("i am")[1].strip().split()[0]
-                        return f"Your name is {name}."
-            return "I don't know your name yet. Please tell me!"
+            if profile.get("name"):
+                return f"Your name is {profile['name']}.", None
+            return "I don't know your name yet. Please tell me!", None
         
         elif "age" in message_lower:
-            for msg in reversed(chat_history):
-                if msg["role"] == "user" and ("i am" in msg["content"].lower() and "years old" in msg["content"].lower()):
-                    age_match = re.search(r'(\d+)\s*years?\s*old', msg["content"].lower())
-                    if age_match:
-                        return f"You are {age_match.group(1)} years old."
-            return "I don't know your age. Please tell me!"
+            if profile.get("age"):
+                return f"You are {profile['age']} years old.", None
+            return "I don't know your age. Please tell me!", None
         
         elif "job" in message_lower or "work" in message_lower:
-            for msg in reversed(chat_history):
-                if msg["role"] == "user":
-                    content = msg["content"].lower()
-                    if "i work" in content or "my job" in content or "i am a" in content:
-                        return f"Based on what you told me: {msg['content']}"
-            return "I don't know about your work. Please tell me!"
+            if profile.get("job"):
+                return f"Based on what you told me: {profile['job']}", None
+            return "I don't know about your work. Please tell me!", None
         
-        # General personal info search
-        relevant_info = []
-        for msg in reversed(chat_history[-10:]):
-            if msg["role"] == "user" and any(word in msg["content"].lower() for word in ["my", "i am", "i work", "i like", "i live"]):
-                relevant_info.append(msg["content"])
+        elif "where do i" in message_lower or "live" in message_lower:
+            if profile.get("location"):
+                return f"You told me you live in {profile['location']}.", None
+            return "I don't know where you live. Please tell me!", None
         
-        if relevant_info:
-            context = "\n".join(relevant_info)
+        # General personal info search
+        context = describe_profile(profile)
+        if context:
             prompt = f"Based on this personal information: {context}\n\nQuestion: {message}\n\nAnswer:"
-            return self.llm.invoke(prompt)
+            return None, prompt
         
-        return "I don't have that information about you yet. Feel free to tell me more about yourself!"
+        return "I don't have that information about you yet. Feel free to tell me more about yourself!", None
     
-    def _handle_document_question(self, message: str, session: dict) -> str:
-        """Handle questions about uploaded document"""
+    async def _handle_document_question(self, message: str, session: dict, query_vector=None):
+        """Handle questions about uploaded document; returns (reply, prompt, cache_key)"""
         try:
-            docs = session["vector_store"].similarity_search(message, k=4)
+            # Embed once: the vector serves both the answer cache and the search
+            if query_vector is None:
+                with span("embed_query"):
+                    # The first call loads the model, which can take seconds
+                    query_vector = await asyncio.to_thread(lambda: get_embeddings().embed_query(message))
+            
+            # The vector lock can be held for a while by ingestion, so it is taken on a worker thread
+            found = await asyncio.to_thread(self._search_documents, message, session, query_vector)
+            if found is None:
+                return "I couldn't find relevant information in the uploaded documents.", None, None
+            if isinstance(found, str):
+                chat_logger.info(f"Answer cache hit for session {session['session_id'][:8]}...")
+                return found, None, None
+            key, docs = found
+            with span("rerank"):
+                # Cross-encoder inference (and its first load) would stall the event loop
+                docs = await asyncio.to_thread(self.retriever.rerank, message, docs, 4)
             if docs:
-                # Get more context for multi-document scenarios
-                context = "\n\n".join([f"Document excerpt {i+1}: {doc.page_content}" for i, doc in enumerate(docs[:3])])
-                
-                # Include document names in prompt
+                # Include document names in prompt; excerpts fill the token budget in rank order
                 doc_names = session.get("filename", "uploaded documents")
-                prompt = f"Context from {doc_names}:\n{context}\n\nQuestion: {message}\n\nAnswer based on the documents (mention which document if relevant):"
+                recent, summary = self._conversation(session)
+                prompt = self.prompts.document_prompt(message, [doc.page_content for doc in docs[:3]], doc_names, recent, summary)
                 
-                return self.llm.invoke(prompt)
+                return None, prompt, (key, query_vector)
             else:
-                return "I couldn't find relevant information in the uploaded documents."
+                return "I couldn't find relevant information in the uploaded documents.", None, None
         except Exception as e:
             chat_logger.error(f"Document search error: {e}")
-            return "I couldn't search the documents. Please try again."
+            return "I couldn't search the documents. Please try again.", None, None
     
-    def _handle_general_question(self, message: str, session: dict) -> str:
-        """Handle general AI questions"""
-        # Include recent chat history for context
-        chat_history = session.get("chat_history", [])
-        recent_context = ""
-        
-        if len(chat_history) > 1:
-            recent_messages = chat_history[-6:]
-            context_parts = []
-            for msg in recent_messages:
-                if msg["role"] == "user":
-                    context_parts.append(f"User: {msg['content']}")
-                else:
-                    context_parts.append(f"Assistant: {msg['content']}")
-            recent_context = "\n".join(context_parts)
-        
-        if recent_context:
-            prompt = f"Previous conversation:\n{recent_context}\n\nUser: {message}\n\nAssistant:"
-        else:
-            prompt = f"User: {message}\n\nAssistant:"
+    def _search_documents(self, message: str, session: dict, query_vector):
+        """Cached answer, or (cache key, candidate chunks), or None without documents; blocks on the vector lock"""
+        # Loaded first: loading takes the storage lock, which must not be taken under the vector lock
+        vector_store = session_manager.get_vector_store(session)
+        if vector_store is None:
+            return None
+        # Ingestion may be swapping a merged index into this store on another thread
+        with session_manager.vector_lock(session["session_id"]):
+            # Answers shaped by one session's conversation must not reach another session
+            key = answer_key(document_fingerprint(vector_store), *self._conversation(session))
+            cached = self.response_cache.get(key, query_vector)
+            if cached is not None:
+                return cached
+            # Keyword and vector matches fused; exact terms like clause IDs rank even when embeddings miss them
+            with span("retrieval"):
+                return key, self.retriever.candidates(vector_store, message, query_vector, k=4)
+    
+    def _handle_general_question(self, message: str, session: dict):
+        """Handle general AI questions; returns (reply, prompt)"""
+        # Recent turns and the rolling summary, trimmed to the token budget
+        recent, summary = self._conversation(session)
+        prompt = self.prompts.general_prompt(message, recent, summary)
         
-        return self.llm.invoke(prompt)
\ No newline at end of file
+        return None, prompt
\ No newline at end of file
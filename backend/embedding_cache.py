@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+import numpy as np
+from faiss_store import load_faiss_store, save_faiss_store
+from logger import storage_logger
+
+# Disk budgets for the two cache levels
+FILE_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+CHUNK_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_CHUNKS", "500000"))
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+class EmbeddingCache:
+    """Content-addressed cache of PDF embeddings, shared across sessions.
+
+    Level 1 maps a file's SHA-256 to the finished FAISS store for that PDF,
+    so re-uploading identical bytes skips parsing and embedding entirely.
+    Level 2 maps each chunk's text hash to its vector, so overlapping PDFs
+    only embed the chunks that are new. Both levels evict least recently
+    used entries once over their size limit.
+    """
+
+    def __init__(self, cache_dir: str = "data/cache", max_file_bytes: int = FILE_CACHE_MAX_BYTES,
+                 max_chunks: int = CHUNK_CACHE_MAX_ENTRIES):
+        self.files_dir = f"{cache_dir}/files"
+        self.db_path = f"{cache_dir}/chunks.db"
+        self.max_file_bytes = max_file_bytes
+        self.max_chunks = max_chunks
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        self.stats = {"file_hits": 0, "file_misses": 0, "chunk_hits": 0, "chunk_misses": 0,
+                      "file_evictions": 0, "chunk_evictions": 0}
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_last_used ON chunks(last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Level 1: whole files
+
+    def get_file(self, file_hash: str):
+        """Load a fresh copy of the cached vector store for this file, or None"""
+        entry_dir = f"{self.files_dir}/{file_hash}"
+        if not os.path.exists(f"{entry_dir}/meta.json"):
+            self.stats["file_misses"] += 1
+            return None
+        try:
+            # Loaded into memory: the caller merges into it and saves it elsewhere
+            vector_store = load_faiss_store(entry_dir, in_memory=True)
+        except Exception as e:
+            storage_logger.warning(f"Dropping unreadable cache entry {file_hash[:12]}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self.stats["file_misses"] += 1
+            return None
+        # mtime of meta.json doubles as the LRU timestamp
+        os.utime(f"{entry_dir}/meta.json")
+        self.stats["file_hits"] += 1
+        return vector_store
+
+    def put_file(self, file_hash: str, vector_store, filename: str = ""):
+        """Store a processed PDF's vector store under its file hash"""
+        entry_dir = f"{self.files_dir}/{file_hash}"
+        tmp_dir = f"{entry_dir}.tmp{threading.get_ident()}"
+        try:
+            save_faiss_store(vector_store, tmp_dir)
+            with open(f"{tmp_dir}/meta.json", "w") as f:
+                json.dump({"filename": filename, "chunks": vector_store.index.ntotal, "created_at": time.time()}, f)
+            if os.path.exists(entry_dir):
+                # Another upload of the same bytes finished first
+                shutil.rmtree(tmp_dir)
+            else:
+                os.rename(tmp_dir, entry_dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            storage_logger.warning(f"Failed to cache embeddings for {file_hash[:12]}: {e}")
+            return
+        self._evict_files()
+
+    def _evict_files(self):
+        with self._evict_lock:
+            entries = []
+            for name in os.listdir(self.files_dir):
+                meta = f"{self.files_dir}/{name}/meta.json"
+                if os.path.exists(meta):
+                    entries.append((os.path.getmtime(meta), name, _dir_size(f"{self.files_dir}/{name}")))
+            total = sum(size for _, _, size in entries)
+            for _, name, size in sorted(entries):
+                if total <= self.max_file_bytes:
+                    break
+                shutil.rmtree(f"{self.files_dir}/{name}", ignore_errors=True)
+                total -= size
+                self.stats["file_evictions"] += 1
+                storage_logger.info(f"Evicted cached embeddings {name[:12]}")
+
+    # Level 2: individual chunks
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Embed texts, reusing cached vectors and embedding only the misses"""
+        hashes = [sha256_text(text) for text in texts]
+        conn = self._conn()
+        cached = {}
+        unique = list(set(hashes))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT hash, vector FROM chunks WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            cached.update((h, np.frombuffer(blob, dtype=np.float32).tolist()) for h, blob in rows)
+
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        self.stats["chunk_hits"] += len(texts) - len(missing)
+        self.stats["chunk_misses"] += len(missing)
+
+        now = time.time()
+        with conn:
+            if missing:
+                vectors = embed_fn(list(missing.values()))
+                for h, vector in zip(missing, vectors):
+                    cached[h] = vector
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (hash, vector, last_used) VALUES (?, ?, ?)",
+                    [(h, np.asarray(cached[h], dtype=np.float32).tobytes(), now) for h in missing]
+                )
+            conn.executemany("UPDATE chunks SET last_used = ? WHERE hash = ?", [(now, h) for h in unique if h not in missing])
+
+        if missing:
+            self._evict_chunks()
+        return [cached[h] for h in hashes]
+
+    def _evict_chunks(self):
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        excess = count - self.max_chunks
+        if excess > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM chunks WHERE hash IN (SELECT hash FROM chunks ORDER BY last_used LIMIT ?)", (excess,)
+                )
+            self.stats["chunk_evictions"] += excess
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Shared embedding cache (None when EMBED_CACHE is disabled)"""
+    global _cache
+    if os.getenv("EMBED_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
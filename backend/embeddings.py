@@ -0,0 +1,218 @@
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+from logger import main_logger
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Embedding stage tuning; 0 disables the optional modes
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+EMBED_PROCESS_WORKERS = int(os.getenv("EMBED_PROCESS_WORKERS", "0"))
+EMBED_COALESCE_MS = float(os.getenv("EMBED_COALESCE_MS", "0"))
+# Largest combined batch when coalescing, as a multiple of EMBED_BATCH_SIZE
+EMBED_COALESCE_FACTOR = int(os.getenv("EMBED_COALESCE_FACTOR", "4"))
+
+# Process-wide embedding model, loaded on first use
+_embeddings = None
+_lock = threading.Lock()
+_load_stats = {}
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size of this process in MB, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # getrusage only has peak RSS, in platform-dependent units; not worth reporting
+        return None
+
+def _load_model(batch_size: int = EMBED_BATCH_SIZE):
+    # Imported here: langchain_community.embeddings alone takes most of a second
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        encode_kwargs={"batch_size": batch_size}
+    )
+
+def set_torch_threads(threads: int):
+    """Limit torch intra-op threads for this process (0 keeps torch's default)"""
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+def get_embeddings():
+    """Return the shared embedding model, loading it on first call"""
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        if _embeddings is None:
+            rss_before = _rss_mb()
+            start = time.perf_counter()
+            set_torch_threads(EMBED_TORCH_THREADS)
+            model = _load_model()
+            load_seconds = time.perf_counter() - start
+            rss_after = _rss_mb()
+            rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+            _load_stats.update({
+                "model_name": EMBEDDING_MODEL_NAME,
+                "load_seconds": round(load_seconds, 3),
+                "memory_mb": round(rss_delta, 1) if rss_delta is not None else None,
+                "loaded_at": time.time()
+            })
+            main_logger.info(
+                f"Embedding model loaded: {EMBEDDING_MODEL_NAME} "
+                f"in {load_seconds:.2f}s" + (f" (+{rss_delta:.0f} MB RSS)" if rss_delta is not None else "")
+            )
+            _embeddings = model
+
+    return _embeddings
+
+def get_load_stats() -> dict:
+    """Load time and memory of the shared embedding model (empty until loaded)"""
+    return dict(_load_stats)
+
+# Per-process model for pool workers
+_worker_model = None
+
+def _init_worker(torch_threads: int, batch_size: int):
+    global _worker_model
+    set_torch_threads(torch_threads)
+    _worker_model = _load_model(batch_size)
+
+def _embed_in_worker(texts: List[str]) -> List[List[float]]:
+    return _worker_model.embed_documents(texts)
+
+class _CoalescingBatcher:
+    """Merges embedding requests from concurrent callers into shared model calls.
+
+    Requests arriving within window_ms of each other are concatenated up
+    to max_batch texts, embedded with one call and split back per caller.
+    """
+
+    def __init__(self, embed_fn, max_batch: int, window_ms: float):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _run(self):
+        carry = None
+        while True:
+            pending = [carry] if carry else [self._queue.get()]
+            carry = None
+            total = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while total < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if total + len(item[0]) > self.max_batch:
+                    carry = item
+                    break
+                pending.append(item)
+                total += len(item[0])
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = self.embed_fn(texts)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
+
+class EmbeddingPipeline:
+    """Batched document embedding with optional process pool and cross-upload batching.
+
+    batch_size texts go to the model per call. process_workers > 0 runs the
+    calls in a pool of processes, each with its own model copy, for CPU-only
+    nodes where one torch process does not use every core. coalesce_ms > 0
+    lets batches from concurrent uploads share model calls of up to
+    EMBED_COALESCE_FACTOR x batch_size texts.
+    """
+
+    def __init__(self, batch_size: int = EMBED_BATCH_SIZE, process_workers: int = EMBED_PROCESS_WORKERS,
+                 coalesce_ms: float = EMBED_COALESCE_MS, torch_threads: int = EMBED_TORCH_THREADS):
+        self.batch_size = batch_size
+        self.process_workers = process_workers
+        self.torch_threads = torch_threads
+        self._pool = None
+        if process_workers > 0:
+            # spawn: forking a process that already loaded torch can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(torch_threads, batch_size)
+            )
+        self._batcher = None
+        if coalesce_ms > 0:
+            self._batcher = _CoalescingBatcher(self._embed_batch, batch_size * EMBED_COALESCE_FACTOR, coalesce_ms)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._pool is not None:
+            return self._pool.submit(_embed_in_worker, texts).result()
+        return get_embeddings().embed_documents(texts)
+
+    def embed(self, texts: List[str], progress=None) -> List[List[float]]:
+        """Embed texts in order; progress(n) is called with the count embedded so far"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors = []
+
+        if self._batcher is not None or self._pool is not None:
+            # Queue every batch up front so workers / the batcher can run them in parallel
+            if self._batcher is not None:
+                futures = [self._batcher.submit(batch) for batch in batches]
+            else:
+                futures = [self._pool.submit(_embed_in_worker, batch) for batch in batches]
+            for future in futures:
+                vectors.extend(future.result())
+                if progress:
+                    progress(len(vectors))
+            return vectors
+
+        for batch in batches:
+            vectors.extend(self._embed_batch(batch))
+            if progress:
+                progress(len(vectors))
+        return vectors
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+_pipeline = None
+
+def get_pipeline() -> EmbeddingPipeline:
+    """Shared embedding pipeline configured from the EMBED_* environment variables"""
+    global _pipeline
+    if _pipeline is None:
+        with _lock:
+            if _pipeline is None:
+                _pipeline = EmbeddingPipeline()
+    return _pipeline
@@ -0,0 +1,308 @@
+import copy
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, Union
+import faiss
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from embeddings import get_embeddings
+from bm25_index import BM25Index
+from index_factory import configure_search
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.db"
+BM25_FILE = "bm25.json"
+# Indexes at least this large are memory-mapped instead of read into the heap
+VECTOR_MMAP_MIN_BYTES = int(os.getenv("VECTOR_MMAP_MIN_BYTES", str(16 * 1024 * 1024)))
+# IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat codes and IVF lists alike; combined with
+# IO_FLAG_MMAP, IVF indexes fail to load, so the older flag is only a fallback
+MMAP_READ_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+DOCSTORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id TEXT PRIMARY KEY,
+    position INTEGER,
+    chunk_hash TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_docs_position ON docs(position);
+"""
+
+def chunk_hash(doc: Document) -> str:
+    # Stores built before chunk hashing existed have no chunk_hash metadata
+    return doc.metadata.get("chunk_hash") or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore kept in a SQLite file next to the index; chunks are read on demand.
+
+    Opening it reads nothing, unlike the pickled InMemoryDocstore that
+    save_local writes. Added documents are written immediately; their
+    index positions are recorded by save_faiss_store.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.executescript(DOCSTORE_SCHEMA)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT content, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO docs (id, chunk_hash, content, metadata) VALUES (?, ?, ?, ?)",
+                [(doc_id, chunk_hash(doc), doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+            )
+
+    def add_positioned(self, docs: Dict[int, tuple]) -> None:
+        """Add documents whose index positions are already known, as {position: (id, document)}"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO docs (id, position, chunk_hash, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(doc_id, position, chunk_hash(doc), doc.page_content, json.dumps(doc.metadata))
+                 for position, (doc_id, doc) in docs.items()]
+            )
+
+    def delete(self, ids) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM docs WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def chunk_hashes(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_hash FROM docs").fetchall()
+        return (row[0] for row in rows)
+
+    def documents(self) -> Iterator[Document]:
+        with self._lock:
+            rows = self._conn.execute("SELECT content, metadata FROM docs").fetchall()
+        return (Document(page_content=content, metadata=json.loads(metadata)) for content, metadata in rows)
+
+    def set_positions(self, index_to_docstore_id: Dict[int, str]):
+        """Record the index positions of documents added since the last save"""
+        with self._lock, self._conn:
+            unsaved = [row[0] for row in self._conn.execute("SELECT id FROM docs WHERE position IS NULL")]
+            if not unsaved:
+                return
+            position_of = {doc_id: position for position, doc_id in index_to_docstore_id.items()}
+            self._conn.executemany(
+                "UPDATE docs SET position = ? WHERE id = ?",
+                [(position_of[doc_id], doc_id) for doc_id in unsaved if doc_id in position_of]
+            )
+
+    def positioned_texts(self) -> Iterator:
+        """(index position, chunk text) of every saved chunk"""
+        with self._lock:
+            rows = self._conn.execute("SELECT position, content FROM docs WHERE position IS NOT NULL").fetchall()
+        return iter(rows)
+
+    def drop_unsaved(self, ntotal: int):
+        """Forget documents whose vectors never reached the saved index (e.g. after a crash)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM docs WHERE position IS NULL OR position >= ?", (ntotal,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class StagedDocstore(Docstore, AddableMixin):
+    """Chunks added to a staged copy, held in memory on top of the original's SQLiteDocstore.
+
+    Nothing reaches docstore.db until commit_staged writes the new chunks
+    with their positions, so a load of the session meanwhile never sees
+    (and prunes) half-merged rows.
+    """
+
+    def __init__(self, base: SQLiteDocstore):
+        self.base = base
+        self._dict: Dict[str, Document] = {}
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._dict.get(search)
+        return doc if doc is not None else self.base.search(search)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self._dict.update(texts)
+
+    def delete(self, ids) -> None:
+        for doc_id in ids:
+            self._dict.pop(doc_id, None)
+
+    def chunk_hashes(self) -> Iterator[str]:
+        return itertools.chain(self.base.chunk_hashes(), (chunk_hash(doc) for doc in self._dict.values()))
+
+    def documents(self) -> Iterator[Document]:
+        return itertools.chain(self.base.documents(), self._dict.values())
+
+def iter_documents(vector_store) -> Iterator[Document]:
+    """Every chunk in a vector store, whichever docstore backs it"""
+    docstore = vector_store.docstore
+    if isinstance(docstore, (SQLiteDocstore, StagedDocstore)):
+        return docstore.documents()
+    return iter(docstore._dict.values())
+
+def iter_chunk_hashes(vector_store) -> Iterator[str]:
+    """Chunk hashes of a vector store without loading chunk text where possible"""
+    docstore = vector_store.docstore
+    if isinstance(docstore, (SQLiteDocstore, StagedDocstore)):
+        return docstore.chunk_hashes()
+    return (chunk_hash(doc) for doc in docstore._dict.values())
+
+def lexical_index(vector_store) -> BM25Index:
+    """The store's BM25 index keyed by index position, built from its chunks if it has none"""
+    bm25 = getattr(vector_store, "_bm25", None)
+    if bm25 is None:
+        bm25 = BM25Index()
+        docstore = vector_store.docstore
+        if isinstance(docstore, SQLiteDocstore):
+            bm25.add(docstore.positioned_texts())
+        # Chunks not saved yet (or not in SQLite at all) are looked up one by one
+        bm25.add((position, docstore.search(doc_id).page_content)
+                 for position, doc_id in vector_store.index_to_docstore_id.items() if position not in bm25.lengths)
+        vector_store._bm25 = bm25
+    return bm25
+
+def index_new_chunks(vector_store, start: int, texts):
+    """Add chunks just appended at positions start.. to the store's BM25 index"""
+    if getattr(vector_store, "_bm25", None) is None:
+        # Built from the docstore, which already holds the new chunks
+        lexical_index(vector_store)
+    else:
+        vector_store._bm25.add(zip(range(start, start + len(texts)), texts))
+
+def staged_copy(vector_store):
+    """A writable copy of a store to merge into while the original keeps serving searches.
+
+    The index is copied into the heap (memory-mapped or not). New chunks
+    go to a StagedDocstore over a SQLite docstore, or to a copy of an
+    in-memory one. The copy has no BM25 index.
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    staged = copy.copy(vector_store)
+    staged.index = faiss.deserialize_index(faiss.serialize_index(vector_store.index))
+    configure_search(staged.index)
+    staged._mmapped = False
+    staged._bm25 = None
+    staged.index_to_docstore_id = dict(vector_store.index_to_docstore_id)
+    if isinstance(vector_store.docstore, SQLiteDocstore):
+        staged.docstore = StagedDocstore(vector_store.docstore)
+    else:
+        staged.docstore = InMemoryDocstore(dict(vector_store.docstore._dict))
+    return staged
+
+def commit_staged(vector_store, staged):
+    """Swap a merged copy's index and chunks into the original store; the BM25 index is the caller's"""
+    docstore = staged.docstore
+    if isinstance(docstore, StagedDocstore):
+        # Rows get their positions now; a load prunes any beyond the saved index,
+        # so callers queue the index save before a reload can happen
+        docstore.base.add_positioned({
+            position: (doc_id, docstore._dict[doc_id])
+            for position, doc_id in staged.index_to_docstore_id.items() if doc_id in docstore._dict
+        })
+        docstore = docstore.base
+    vector_store.index = staged.index
+    vector_store.index_to_docstore_id = staged.index_to_docstore_id
+    vector_store.docstore = docstore
+    vector_store._mmapped = False
+
+def save_faiss_store(vector_store, folder_path: str):
+    """Write index.faiss and docstore.db; the index file is replaced atomically"""
+    os.makedirs(folder_path, exist_ok=True)
+    db_path = f"{folder_path}/{DOCSTORE_FILE}"
+    docstore = vector_store.docstore
+
+    if isinstance(docstore, SQLiteDocstore) and os.path.abspath(docstore.path) == os.path.abspath(db_path):
+        # Chunks are already on disk; only new positions need recording
+        docstore.set_positions(vector_store.index_to_docstore_id)
+    else:
+        tmp_db = f"{db_path}.tmp"
+        if os.path.exists(tmp_db):
+            os.remove(tmp_db)
+        conn = sqlite3.connect(tmp_db)
+        try:
+            with conn:
+                conn.executescript(DOCSTORE_SCHEMA)
+                conn.executemany(
+                    "INSERT INTO docs (id, position, chunk_hash, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (doc_id, position, chunk_hash(doc), doc.page_content, json.dumps(doc.metadata))
+                        for position, doc_id in vector_store.index_to_docstore_id.items()
+                        for doc in [docstore.search(doc_id)]
+                    ]
+                )
+        finally:
+            conn.close()
+        os.replace(tmp_db, db_path)
+
+    # Never write over the file in place: a memory-mapped reader would see it change
+    tmp_index = f"{folder_path}/{INDEX_FILE}.tmp"
+    faiss.write_index(vector_store.index, tmp_index)
+    os.replace(tmp_index, f"{folder_path}/{INDEX_FILE}")
+    lexical_index(vector_store).save(f"{folder_path}/{BM25_FILE}")
+
+    legacy_pickle = f"{folder_path}/index.pkl"
+    if os.path.exists(legacy_pickle):
+        os.remove(legacy_pickle)
+
+def load_faiss_store(folder_path: str, in_memory: bool = False):
+    """Load a vector store folder with the shared embedding model.
+
+    Large indexes are memory-mapped and chunks stay in docstore.db until
+    searched, unless in_memory is set (for stores that will be modified
+    and saved elsewhere). Folders written by save_local are still read.
+    """
+    db_path = f"{folder_path}/{DOCSTORE_FILE}"
+    if not os.path.exists(db_path):
+        return _load_pickled(folder_path)
+
+    index_path = f"{folder_path}/{INDEX_FILE}"
+    mmap = not in_memory and os.path.getsize(index_path) >= VECTOR_MMAP_MIN_BYTES
+    index = faiss.read_index(index_path, MMAP_READ_FLAGS if mmap else 0)
+    # nprobe / efSearch follow the current configuration, not what was saved
+    configure_search(index)
+
+    docstore = SQLiteDocstore(db_path)
+    docstore.drop_unsaved(index.ntotal)
+    with docstore._lock:
+        rows = docstore._conn.execute("SELECT position, id FROM docs").fetchall()
+    index_to_docstore_id = dict(rows)
+    # The langchain vector store is only needed once a store is actually loaded
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    if in_memory:
+        memory_docstore = InMemoryDocstore({doc_id: docstore.search(doc_id) for doc_id in index_to_docstore_id.values()})
+        docstore.close()
+        docstore = memory_docstore
+
+    vector_store = FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+    vector_store._mmapped = mmap
+    bm25_path = f"{folder_path}/{BM25_FILE}"
+    if os.path.exists(bm25_path):
+        bm25 = BM25Index.load(bm25_path)
+        # Written after the index; after a crash in between it is rebuilt on first use
+        if len(bm25) == index.ntotal:
+            vector_store._bm25 = bm25
+    return vector_store
+
+def _load_pickled(folder_path: str):
+    from langchain_community.vectorstores import FAISS
+    kwargs = {}
+    # Newer langchain-community refuses to unpickle the docstore unless told to;
+    # older releases forward unknown kwargs to FAISS() and fail on it
+    if "allow_dangerous_deserialization" in inspect.signature(FAISS.__init__).parameters or \
+            "allow_dangerous_deserialization" in inspect.signature(FAISS.load_local).parameters:
+        kwargs["allow_dangerous_deserialization"] = True
+    return FAISS.load_local(folder_path, get_embeddings(), **kwargs)
@@ -0,0 +1,37 @@
+"""Gunicorn settings for running several API workers on one host.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The embedding model is loaded once in the master before the workers are
+forked, so its weights are shared copy-on-write instead of loaded per
+worker. Only the model is preloaded: main (storage, threads, SQLite
+connections) is imported in each worker after the fork. Workers run in
+multi-worker session mode (see worker_sync.py) and must share the same
+working directory, since data/ and uploads/ are relative paths.
+"""
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Ingestion runs on background threads, but a slow LLM reply can hold a request for a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 60
+# Workers import main themselves, after the fork
+preload_app = False
+
+def on_starting(server):
+    # Read by worker_sync at import time in every worker
+    os.environ["SESSION_MULTI_WORKER"] = "1"
+    if os.getenv("PRELOAD_EMBEDDINGS", "1") == "1":
+        import embeddings
+        # Load only: running inference here would start torch's thread pool, which does not survive fork
+        embeddings.get_embeddings()
+        # Keep the collector from writing to the preloaded objects' pages in each worker
+        gc.freeze()
+
+def post_fork(server, worker):
+    # Split the cores between workers unless told otherwise
+    import embeddings
+    embeddings.set_torch_threads(int(os.getenv("EMBED_TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers))
@@ -0,0 +1,103 @@
+import os
+import threading
+from typing import Dict, List, Sequence
+import numpy as np
+from langchain.docstore.document import Document
+from faiss_store import lexical_index
+from shared_index import SessionVectorView
+from logger import chat_logger
+
+# "hybrid" fuses BM25 and vector rankings; "vector" is plain similarity search
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Reciprocal-rank-fusion constant; larger values flatten the weight of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Optional cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; empty disables reranking
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+# Fused candidates scored by the reranker; bounds its cost per question
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "8"))
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """Merge ranked key lists: each key scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def dense_ranking(vector_store, query_vector, k: int) -> List[int]:
+    """Keys of the k nearest chunks (FAISS positions, or vector ids for a shared-index view)"""
+    if isinstance(vector_store, SessionVectorView):
+        return vector_store.search_ids(query_vector, k)
+    _, ids = vector_store.index.search(np.asarray([query_vector], dtype=np.float32), k)
+    return [int(i) for i in ids[0] if i >= 0]
+
+def lexical_ranking(vector_store, query: str, k: int) -> List[int]:
+    index = vector_store.lexical_index() if isinstance(vector_store, SessionVectorView) else lexical_index(vector_store)
+    return [key for key, _ in index.search(query, k)]
+
+def fetch_documents(vector_store, keys: List[int]) -> List[Document]:
+    if isinstance(vector_store, SessionVectorView):
+        return vector_store.documents(keys)
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[key]) for key in keys]
+
+class HybridRetriever:
+    """BM25 + vector retrieval fused by reciprocal rank, with an optional reranker.
+
+    candidates() needs the session's vector lock; rerank() does not, so
+    the cross-encoder never holds up ingestion into the same session.
+    """
+
+    def __init__(self, mode: str = RETRIEVAL_MODE, candidates: int = RETRIEVAL_CANDIDATES,
+                 reranker_model: str = RERANKER_MODEL, rerank_candidates: int = RERANK_CANDIDATES):
+        self.mode = mode
+        self.candidate_count = candidates
+        self.reranker_model = reranker_model
+        self.rerank_candidates = rerank_candidates
+        self._reranker = None
+        self._reranker_lock = threading.Lock()
+
+    def candidates(self, vector_store, query: str, query_vector, k: int = 4) -> List[Document]:
+        """Best chunks for the query, enough of them to feed the reranker if one is configured"""
+        limit = max(k, self.rerank_candidates) if self.reranker_model else k
+        if self.mode != "hybrid":
+            return fetch_documents(vector_store, dense_ranking(vector_store, query_vector, limit))
+        depth = max(limit, self.candidate_count)
+        fused = reciprocal_rank_fusion([
+            dense_ranking(vector_store, query_vector, depth),
+            lexical_ranking(vector_store, query, depth)
+        ])
+        return fetch_documents(vector_store, fused[:limit])
+
+    def rerank(self, query: str, docs: List[Document], k: int = 4) -> List[Document]:
+        """Reorder candidates with the cross-encoder (if configured) and keep k"""
+        model = self._get_reranker() if len(docs) > 1 else None
+        if model is None:
+            return docs[:k]
+        docs = docs[:self.rerank_candidates]
+        scores = model.predict([(query, doc.page_content) for doc in docs])
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:k]]
+
+    def retrieve(self, vector_store, query: str, query_vector, k: int = 4) -> List[Document]:
+        return self.rerank(query, self.candidates(vector_store, query, query_vector, k), k)
+
+    def preload(self):
+        """Load the reranker now rather than on the first question"""
+        self._get_reranker()
+
+    def _get_reranker(self):
+        if not self.reranker_model:
+            return None
+        with self._reranker_lock:
+            if self._reranker is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = CrossEncoder(self.reranker_model, device="cpu")
+                    chat_logger.info(f"Loaded reranker {self.reranker_model}")
+                except Exception as e:
+                    # Retrieval still works without it; don't retry on every question
+                    chat_logger.warning(f"Reranker {self.reranker_model} unavailable, continuing without: {e}")
+                    self.reranker_model = ""
+            return self._reranker
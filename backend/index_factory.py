@@ -0,0 +1,107 @@
+import math
+import os
+import faiss
+import numpy as np
+from logger import storage_logger
+
+# "auto" picks by chunk count; or force one of INDEX_TYPES
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Chunk counts at which "auto" moves to IVF-Flat and then IVF-PQ
+VECTOR_IVF_MIN_CHUNKS = int(os.getenv("VECTOR_IVF_MIN_CHUNKS", "5000"))
+VECTOR_PQ_MIN_CHUNKS = int(os.getenv("VECTOR_PQ_MIN_CHUNKS", "100000"))
+# Search/build knobs; see benchmarks/bench_index_types.py for recall vs. latency
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+VECTOR_PQ_M = int(os.getenv("VECTOR_PQ_M", "48"))
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "80"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+
+# Training points faiss wants per IVF list, and the 256 PQ centroids per sub-quantizer
+_POINTS_PER_LIST = 39
+_PQ_MIN_TRAIN = 256 * _POINTS_PER_LIST
+# Rebuilds only ever move forward: reconstructing from PQ codes would lose precision
+_UPGRADE_ORDER = {"flat": 0, "hnsw": 0, "ivf_flat": 1, "ivf_pq": 2}
+
+def choose_index_type(n_chunks: int, configured: str = VECTOR_INDEX_TYPE) -> str:
+    """Index type for a store of n_chunks vectors"""
+    if configured == "auto":
+        if n_chunks >= VECTOR_PQ_MIN_CHUNKS:
+            configured = "ivf_pq"
+        elif n_chunks >= VECTOR_IVF_MIN_CHUNKS:
+            configured = "ivf_flat"
+        else:
+            return "flat"
+    if configured not in INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {configured}")
+    # Too few vectors to train the quantizers; flat is exact and just as fast here
+    if configured == "ivf_pq" and n_chunks < _PQ_MIN_TRAIN:
+        configured = "ivf_flat"
+    if configured == "ivf_flat" and n_chunks < 16 * _POINTS_PER_LIST:
+        configured = "flat"
+    return configured
+
+def index_type(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def _nlist(n_chunks: int) -> int:
+    # ~4*sqrt(n) lists, with enough points per list to train the centroids
+    return max(16, min(int(4 * math.sqrt(n_chunks)), n_chunks // _POINTS_PER_LIST, 65536))
+
+def _pq_m(dimension: int) -> int:
+    # The number of sub-quantizers must divide the dimension
+    m = min(VECTOR_PQ_M, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+def build_index(vectors: np.ndarray, kind: str) -> faiss.Index:
+    """A trained index of the given type holding vectors in order (positions are kept)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dimension = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, VECTOR_HNSW_M)
+        index.hnsw.efConstruction = VECTOR_HNSW_EF_CONSTRUCTION
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, _nlist(n))
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, _nlist(n), _pq_m(dimension), 8)
+        index.train(vectors)
+        # Keeps reconstruct() working, which merging and routing rely on
+        index.make_direct_map()
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+def configure_search(index):
+    """Apply the configured search-time parameters to a built or loaded index"""
+    kind = index_type(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = VECTOR_IVF_NPROBE
+    elif kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = VECTOR_HNSW_EF_SEARCH
+
+def maybe_reindex(vector_store) -> bool:
+    """Rebuild a store's index if its size now calls for a different type; returns True if rebuilt"""
+    current = index_type(vector_store.index)
+    target = choose_index_type(vector_store.index.ntotal)
+    if target == current or _UPGRADE_ORDER[target] < _UPGRADE_ORDER[current]:
+        return False
+    if _UPGRADE_ORDER[target] == _UPGRADE_ORDER[current] and VECTOR_INDEX_TYPE == "auto":
+        # flat <-> hnsw only on explicit configuration
+        return False
+    vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+    vector_store.index = build_index(vectors, target)
+    storage_logger.info(f"Rebuilt vector index as {target} ({len(vectors)} vectors)")
+    return True
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from logger import main_logger
+
+# PDFs processed at once, and how many more may wait before uploads are refused
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "16"))
+# Finished jobs stay queryable for this long
+JOB_RETENTION_SECONDS = float(os.getenv("INGEST_JOB_RETENTION", "3600"))
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept another job"""
+
+class IngestionQueue:
+    """Runs PDF ingestion jobs on a bounded worker pool and tracks their progress.
+
+    handler(job_id, **params) does the work; it can report progress by
+    calling update(job_id, ...) and its return value becomes the job result.
+    With state_dir set, every change to a job is also written there as JSON,
+    so other worker processes can answer status polls for it.
+    """
+
+    def __init__(self, handler, max_workers: int = INGEST_WORKERS, max_queue: int = INGEST_QUEUE_DEPTH,
+                 state_dir: str = None):
+        self.handler = handler
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = {}
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    def submit(self, **params) -> dict:
+        """Queue a job; raises QueueFullError when workers and queue are all busy"""
+        with self._lock:
+            self._prune()
+            if self._outstanding >= self.max_workers + self.max_queue:
+                raise QueueFullError("Ingestion queue is full")
+            job_id = str(uuid.uuid4())
+            job = {
+                "job_id": job_id,
+                "status": "queued",
+                "session_id": params.get("session_id"),
+                "filename": params.get("filename"),
+                "pages_parsed": 0,
+                "pages_total": None,
+                "chunks_embedded": 0,
+                "chunks_total": None,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None
+            }
+            self._jobs[job_id] = job
+            self._outstanding += 1
+            self._publish(job)
+
+        self._executor.submit(self._run, job_id, params)
+        return dict(job)
+
+    def get(self, job_id: str):
+        """Snapshot of a job's state, or None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        # Submitted to another worker process
+        return self._read_published(job_id)
+
+    def update(self, job_id: str, **progress):
+        """Record progress fields (pages_parsed, chunks_embedded, ...) for a running job"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(progress)
+                self._publish(self._jobs[job_id])
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._outstanding
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job_id: str, params: dict):
+        self.update(job_id, status="processing", started_at=time.time())
+        try:
+            result = self.handler(job_id, **params)
+            self.update(job_id, status="done", result=result, finished_at=time.time())
+        except Exception as e:
+            main_logger.error(f"Ingestion job {job_id[:8]}... failed: {e}")
+            self.update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    def _prune(self):
+        """Forget finished jobs past their retention; caller holds the lock"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.state_dir:
+            # Includes jobs published by other workers
+            for name in os.listdir(self.state_dir):
+                path = f"{self.state_dir}/{name}"
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _publish(self, job: dict):
+        """Write a job's state for other workers; caller holds the lock"""
+        if not self.state_dir:
+            return
+        path = f"{self.state_dir}/{job['job_id']}.json"
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(job, f)
+            os.replace(f"{path}.tmp", path)
+        except (OSError, TypeError) as e:
+            main_logger.warning(f"Could not publish ingestion job {job['job_id'][:8]}...: {e}")
+
+    def _read_published(self, job_id: str):
+        if not self.state_dir:
+            return None
+        try:
+            with open(f"{self.state_dir}/{os.path.basename(job_id)}.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
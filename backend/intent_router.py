@@ -0,0 +1,102 @@
+import contextlib
+import os
+import re
+from typing import List, NamedTuple, Optional
+import numpy as np
+from embeddings import get_embeddings
+from shared_index import SessionVectorView
+from metrics import span
+
+PERSONAL = "personal"
+DOCUMENT = "document"
+GENERAL = "general"
+
+PERSONAL_KEYWORDS = [
+    "my name", "what is my", "who am i", "remember", "i told you",
+    "what did i say", "do you know my", "about me", "my age",
+    "my job", "my work", "my hobby", "my favorite", "where do i"
+]
+DOCUMENT_KEYWORDS = [
+    "document", "pdf", "file", "text", "according to", "based on",
+    "in the document", "what does it say", "from the file"
+]
+
+# Cosine similarity between the question and its best chunk needed to send
+# a question without document keywords down the retrieval path
+ROUTER_DOCUMENT_THRESHOLD = float(os.getenv("ROUTER_DOCUMENT_THRESHOLD", "0.45"))
+
+class Route(NamedTuple):
+    intent: str
+    # Set when the fallback embedded the question, so retrieval can reuse it
+    query_vector: Optional[List[float]] = None
+    score: Optional[float] = None
+
+def compile_keywords(keywords: List[str]):
+    """One alternation over lowercase keywords, matched in a single pass"""
+    # Longest first so overlapping keywords match the more specific one
+    return re.compile("|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+class IntentRouter:
+    """Cheap-first routing of chat messages to the personal/document/general handlers.
+
+    Keywords are matched with one compiled regex per intent. Messages
+    with no keyword hit in a session that has documents are embedded and
+    routed to retrieval only if the closest chunk is similar enough.
+    """
+
+    def __init__(self, embed_query=None, document_threshold: float = ROUTER_DOCUMENT_THRESHOLD):
+        self._personal = compile_keywords(PERSONAL_KEYWORDS)
+        self._document = compile_keywords(DOCUMENT_KEYWORDS)
+        self._embed_query = embed_query
+        self.document_threshold = document_threshold
+
+    def match_keywords(self, message: str) -> Optional[str]:
+        """Intent from keywords alone; personal wins over document, as before"""
+        # Lowercasing once beats re.IGNORECASE, and a single combined
+        # pattern would still have to scan past document hits for personal ones
+        message_lower = message.lower()
+        if self._personal.search(message_lower):
+            return PERSONAL
+        if self._document.search(message_lower):
+            return DOCUMENT
+        return None
+
+    def route(self, message: str, load_store=None, lock=None) -> Route:
+        """Pick a handler; load_store returns the session's vector store (None without documents)"""
+        intent = self.match_keywords(message)
+        if intent == PERSONAL:
+            return Route(PERSONAL)
+        if load_store is None:
+            return Route(GENERAL)
+        if intent == DOCUMENT:
+            return Route(DOCUMENT)
+
+        with span("embed_query"):
+            query_vector = self._embed(message)
+        # Only now is the store needed, so sessions that never search never load it;
+        # loading takes its own locks, so it happens before the search lock is held
+        vector_store = load_store()
+        with lock or contextlib.nullcontext():
+            score = top_similarity(vector_store, query_vector) if vector_store is not None else 0.0
+        intent = DOCUMENT if score >= self.document_threshold else GENERAL
+        return Route(intent, query_vector, score)
+
+    def _embed(self, message: str):
+        if self._embed_query is None:
+            return get_embeddings().embed_query(message)
+        return self._embed_query(message)
+
+def top_similarity(vector_store, query_vector) -> float:
+    """Cosine similarity between the query and its nearest stored chunk"""
+    if isinstance(vector_store, SessionVectorView):
+        return vector_store.top_similarity(query_vector)
+    index = vector_store.index
+    if index.ntotal == 0:
+        return 0.0
+    query = np.asarray([query_vector], dtype=np.float32)
+    _, ids = index.search(query, 1)
+    if ids[0][0] < 0:
+        return 0.0
+    nearest = index.reconstruct(int(ids[0][0]))
+    norms = np.linalg.norm(query[0]) * np.linalg.norm(nearest)
+    return float(np.dot(query[0], nearest) / norms) if norms else 0.0
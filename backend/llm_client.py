@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Optional
+from logger import chat_logger
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# Generations running at once, and how many more may wait for a slot
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+# Seconds a whole generation may take, including time spent queued
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Suggested client back-off when the queue is full
+LLM_RETRY_AFTER = int(os.getenv("LLM_RETRY_AFTER", "5"))
+
+class LLMBusyError(Exception):
+    """Raised when every generation slot is taken and the wait queue is full"""
+
+    def __init__(self, retry_after: int = LLM_RETRY_AFTER):
+        super().__init__("LLM is busy, please retry shortly")
+        self.retry_after = retry_after
+
+class LLMTimeoutError(Exception):
+    """Raised when a generation exceeds its timeout"""
+
+class AsyncOllamaClient:
+    """Async client for Ollama's /api/generate with bounded, fair concurrency.
+
+    At most max_in_flight generations run at once; up to max_queue more
+    wait in FIFO order for a slot and anything beyond that is rejected with
+    LLMBusyError. Requests share one keep-alive connection pool.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL, temperature: float = 0.7,
+                 max_in_flight: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_MAX_QUEUE,
+                 timeout: float = LLM_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.temperature = temperature
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._client = None
+        self._slots = None
+        self._in_flight = 0
+        self._waiting = 0
+        self.rejected = 0
+
+    def _http(self) -> "httpx.AsyncClient":
+        # Created on first use so it binds to the running event loop
+        if self._client is None:
+            # Imported on first use: httpx adds ~150ms to server startup
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+                timeout=httpx.Timeout(self.timeout, connect=10)
+            )
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    def is_saturated(self) -> bool:
+        """True when a new request would be rejected"""
+        return self._in_flight + self._waiting >= self.max_in_flight + self.max_queue
+
+    def stats(self) -> dict:
+        return {"in_flight": self._in_flight, "queued": self._waiting, "rejected": self.rejected}
+
+    async def _acquire(self, deadline: float):
+        self._http()
+        if self.is_saturated():
+            self.rejected += 1
+            raise LLMBusyError()
+        self._waiting += 1
+        try:
+            # asyncio.Semaphore wakes waiters in arrival order
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError("Timed out waiting for a free LLM slot")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {"model": self.model, "prompt": prompt, "stream": stream, "options": {"temperature": self.temperature}}
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Return the full completion for prompt"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        await self._acquire(deadline)
+        try:
+            response = await asyncio.wait_for(
+                self._client.post("/api/generate", json=self._payload(prompt, stream=False)),
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+            response.raise_for_status()
+            return response.json().get("response", "")
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"LLM generation exceeded {timeout}s")
+        finally:
+            self._release()
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield completion tokens as they arrive; closing the iterator aborts generation"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        await self._acquire(deadline)
+        try:
+            async with self._client.stream("POST", "/api/generate", json=self._payload(prompt, stream=True)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if time.monotonic() > deadline:
+                        raise LLMTimeoutError(f"LLM generation exceeded {timeout}s")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        finally:
+            # Leaving the stream context closes the connection, which stops Ollama generating
+            self._release()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            chat_logger.info("LLM client closed")
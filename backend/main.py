@@ -1,19 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
 import uuid
-import os
+import hashlib
 import json
+import os
 import uvicorn
 import threading
 import time
 from pdf_processor import PDFProcessor
 import session_manager
 from chat_handler import ChatHandler
+from ingest_jobs import IngestionQueue, QueueFullError
+from llm_client import LLMBusyError, LLMTimeoutError, LLM_RETRY_AFTER
 from logger import main_logger, session_logger
+from embedding_cache import get_cache
+from embeddings import get_load_stats
+import metrics
+from metrics import span
+from worker_sync import MULTI_WORKER
+from warmup import DEFAULT_STEPS, Warmup
 
 app = FastAPI()
 
+# Bytes read from an upload per write to disk
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Seconds between runs of the expired-session cleanup
+CLEANUP_INTERVAL = float(os.getenv("SESSION_CLEANUP_INTERVAL", str(24 * 60 * 60)))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://chatbot-gamma-tan.vercel.app"],
@@ -22,10 +39,90 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
+# Initialize components; both are cheap, the embedding model loads in the warmup
 pdf_processor = PDFProcessor()
 chat_handler = ChatHandler()
 
+# Model load and first inference run in the background; /ready reports when they are done
+warmup = Warmup(DEFAULT_STEPS + ([("reranker", chat_handler.retriever.preload)] if chat_handler.retriever.reranker_model else []))
+
+@metrics.timed("ingest_total")
+def ingest_pdf(job_id: str, session_id: str, file_path: str, filename: str, file_hash: str = None) -> dict:
+    """Ingestion job: build the PDF's vector store and merge it into the session"""
+    vector_store = pdf_processor.process_pdf(
+        file_path,
+        progress=lambda **progress: ingestion_queue.update(job_id, **progress),
+        file_hash=file_hash
+    )
+    
+    # Update existing session or create new one (preserves chat history)
+    with span("session_merge"):
+        updated_session = session_manager.update_session_with_pdf(session_id, vector_store, filename)
+    main_logger.info(f"PDF processed successfully: {filename} for session {session_id[:8]}...")
+    return {"session_id": session_id, "filename": updated_session.get("filename", filename)}
+
+# With several workers a job's status poll may land on a process that did not run it
+ingestion_queue = IngestionQueue(ingest_pdf, state_dir="data/jobs" if MULTI_WORKER else None)
+
+# Prometheus metrics; stage latencies are recorded where the work happens (see metrics.span)
+HTTP_SECONDS = metrics.histogram(
+    "chatbot_http_request_duration_seconds", "HTTP request latency by route", labels=("method", "route", "status")
+)
+
+def _cache_counts(key: str) -> dict:
+    """Per-cache totals for one of hits/misses from each cache's own stats"""
+    counts = {
+        ("response",): chat_handler.response_cache.stats()[key],
+        ("session",): session_manager.cache_stats()[key]
+    }
+    cache = get_cache()
+    if cache is not None:
+        counts[("embedding_file",)] = cache.stats[f"file_{key}"]
+        counts[("embedding_chunk",)] = cache.stats[f"chunk_{key}"]
+    return counts
+
+def _cache_evictions() -> dict:
+    evictions = {("response", "lru"): chat_handler.response_cache.stats()["evictions"]}
+    for reason, count in session_manager.cache_stats()["evictions"].items():
+        evictions[("session", reason)] = count
+    cache = get_cache()
+    if cache is not None:
+        evictions[("embedding_file", "size")] = cache.stats["file_evictions"]
+        evictions[("embedding_chunk", "size")] = cache.stats["chunk_evictions"]
+    return evictions
+
+metrics.counter("chatbot_cache_hits_total", "Cache hits", labels=("cache",), collect=lambda: _cache_counts("hits"))
+metrics.counter("chatbot_cache_misses_total", "Cache misses", labels=("cache",), collect=lambda: _cache_counts("misses"))
+metrics.counter("chatbot_cache_evictions_total", "Cache evictions", labels=("cache", "reason"), collect=_cache_evictions)
+metrics.counter("chatbot_llm_rejected_total", "LLM requests rejected because the queue was full",
+                collect=lambda: chat_handler.llm.rejected)
+metrics.gauge("chatbot_resident_sessions", "Sessions held in memory",
+              collect=lambda: session_manager.cache_stats()["resident_sessions"])
+metrics.gauge("chatbot_resident_session_bytes", "Estimated memory held by resident sessions",
+              collect=lambda: session_manager.cache_stats()["estimated_bytes"])
+metrics.gauge("chatbot_resident_vectors", "Vectors in loaded session vector stores",
+              collect=session_manager.resident_vectors)
+metrics.gauge("chatbot_llm_in_flight", "LLM generations running", collect=lambda: chat_handler.llm.stats()["in_flight"])
+metrics.gauge("chatbot_llm_queued", "LLM generations waiting for a slot", collect=lambda: chat_handler.llm.stats()["queued"])
+metrics.gauge("chatbot_ingest_outstanding", "PDF ingestion jobs queued or running", collect=ingestion_queue.queue_depth)
+metrics.gauge("chatbot_ready", "1 once the startup warmup has finished", collect=lambda: int(warmup.is_ready()))
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, so session ids don't explode the label set
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=status
+        )
+
 class ChatMessage(BaseModel):
     message: str
     session_id: str
@@ -50,67 +147,166 @@ async def upload_pdf(file: UploadFile = File(...), session_id: str = Form(None))
         main_logger.info(f"Using existing session_id: {session_id[:8]}...")
     
     try:
-        # Save uploaded file
-        file_path = f"uploads/{session_id}_{file.filename}"
+        # Save uploaded file (unique name so concurrent uploads of the same file don't collide)
+        file_path = f"uploads/{session_id}_{uuid.uuid4().hex[:8]}_{file.filename}"
         os.makedirs("uploads", exist_ok=True)
         
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Process PDF and create vector store
-        vector_store = pdf_processor.process_pdf(file_path)
-        
-        # Update existing session or create new one (preserves chat history)
-        updated_session = session_manager.update_session_with_pdf(session_id, vector_store, file.filename)
+        # Stream to disk in chunks so the whole upload never sits in memory,
+        # hashing as we go so identical PDFs can reuse cached embeddings
+        digest = hashlib.sha256()
+        with span("upload_write"), open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+                f.write(chunk)
         
-        main_logger.info(f"PDF processed successfully: {file.filename} for session {session_id[:8]}...")
-        return {"session_id": session_id, "filename": updated_session.get("filename", file.filename)}
+        # Parsing and embedding run on the ingestion pool; the client polls /ingest/{job_id}
+        job = ingestion_queue.submit(
+            session_id=session_id,
+            file_path=file_path,
+            filename=file.filename,
+            file_hash=digest.hexdigest()
+        )
+        main_logger.info(f"PDF queued for ingestion: {file.filename} for session {session_id[:8]}... (job {job['job_id'][:8]}...)")
+        return {"session_id": session_id, "filename": file.filename, "job_id": job["job_id"], "status": job["status"]}
     
+    except QueueFullError:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        main_logger.warning(f"Ingestion queue full, rejected upload for session {session_id[:8]}...")
+        raise HTTPException(status_code=429, detail="Too many PDFs are being processed. Please try again shortly.", headers={"Retry-After": "10"})
     except Exception as e:
-        main_logger.error(f"PDF processing error: {e}")
+        main_logger.error(f"PDF upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+@app.get("/ingest/{job_id}")
+async def get_ingest_status(job_id: str):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+def _ensure_session(session_id: str):
+    # Session storage reads the disk and may wait on locks, so endpoints call this on a worker thread
+    if not session_manager.get_session(session_id):
+        session_manager.create_session(session_id, None, "General Chat")
+        session_logger.info(f"Created new session: {session_id[:8]}...")
+
 @app.post("/chat")
 async def chat(chat_message: ChatMessage):
     try:
         # Create session if it doesn't exist (for general chat without PDF)
-        if not session_manager.get_session(chat_message.session_id):
-            session_manager.create_session(chat_message.session_id, None, "General Chat")
-            session_logger.info(f"Created new session: {chat_message.session_id[:8]}...")
+        await asyncio.to_thread(_ensure_session, chat_message.session_id)
         
-        response = chat_handler.handle_message(chat_message.message, chat_message.session_id)
+        response = await chat_handler.handle_message(chat_message.message, chat_message.session_id)
         return ChatResponse(response=response, session_id=chat_message.session_id)
+    except LLMBusyError as e:
+        main_logger.warning("Chat rejected, LLM queue full")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except LLMTimeoutError as e:
+        main_logger.error(f"Chat timeout: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         main_logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/chat-history/{session_id}")
-async def get_chat_history(session_id: str):
-    session = session_manager.get_session(session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
-    # Check if session has vector store from JSON data
-    session_file = f"data/sessions/{session_id}.json"
-    has_vector_store = False
-    if os.path.exists(session_file):
+@app.post("/chat/stream")
+async def chat_stream(chat_message: ChatMessage, request: Request):
+    """Server-sent events: one {"token": ...} event per chunk, then {"done": true}"""
+    # Refuse up front; once the stream has started the status code is already sent
+    if chat_handler.llm.is_saturated():
+        raise HTTPException(status_code=429, detail="LLM is busy, please retry shortly", headers={"Retry-After": str(LLM_RETRY_AFTER)})
+    
+    # Create session if it doesn't exist (for general chat without PDF)
+    await asyncio.to_thread(_ensure_session, chat_message.session_id)
+    
+    async def events():
         try:
-            with open(session_file, 'r') as f:
-                json_data = json.load(f)
-            has_vector_store = json_data.get("has_vector_store", False)
-        except:
-            pass
+            async for token in chat_handler.stream_message(
+                chat_message.message, chat_message.session_id, is_disconnected=request.is_disconnected
+            ):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield f"data: {json.dumps({'done': True, 'session_id': chat_message.session_id})}\n\n"
+        except Exception as e:
+            main_logger.error(f"Chat stream error: {e}")
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
     
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/chat/metrics")
+async def chat_metrics():
     return {
-        "history": session.get("chat_history", []),
-        "filename": session.get("filename", ""),
-        "has_vector_store": has_vector_store
+        "time_to_first_token": chat_handler.ttft_stats(),
+        "llm": chat_handler.llm.stats(),
+        "response_cache": chat_handler.response_cache.stats()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latency histograms, cache counters and resource gauges in the Prometheus text format"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests, warmed up or not"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the embedding model is loaded and warmed up, 503 until then"""
+    status = warmup.status()
+    if not warmup.is_ready():
+        return JSONResponse(status_code=503, content=status)
+    return {**status, "embedding_model": get_load_stats()}
+
+@app.get("/chat-history/{session_id}")
+async def get_chat_history(session_id: str, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    page = await asyncio.to_thread(session_manager.get_chat_history_page, session_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "history": page["history"],
+        "total": page["total"],
+        "offset": offset,
+        "filename": page["filename"],
+        "has_vector_store": page["has_vector_store"]
+    }
+
+@app.on_event("startup")
+def start_warmup():
+    warmup.start()
+
+@app.on_event("startup")
+def start_cleanup():
+    # Runs in every worker; session_manager elects the one that deletes from storage
+    def cleanup_task():
+        while True:
+            time.sleep(CLEANUP_INTERVAL)
+            try:
+                session_manager.cleanup_old_sessions()
+                main_logger.info("Session cleanup completed")
+            except Exception as e:
+                main_logger.error(f"Cleanup error: {e}")
+    
+    threading.Thread(target=cleanup_task, name="session-cleanup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await chat_handler.llm.aclose()
+
+@app.on_event("shutdown")
+def flush_sessions():
+    # Let running ingestion jobs finish, then durably flush queued session writes
+    ingestion_queue.shutdown(wait=True)
+    session_manager.shutdown()
+
 @app.delete("/session/{session_id}")
 async def delete_session_endpoint(session_id: str):
     try:
-        session_manager.delete_session(session_id)
+        await asyncio.to_thread(session_manager.delete_session, session_id)
         main_logger.info(f"Session deleted: {session_id[:8]}...")
         return {"message": "Session deleted successfully"}
     except Exception as e:
@@ -118,18 +314,6 @@ async def delete_session_endpoint(session_id: str):
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
 
 if __name__ == "__main__":
-    # Start cleanup task in background
-    def cleanup_task():
-        while True:
-            time.sleep(24 * 60 * 60)  # Run daily
-            try:
-                session_manager.cleanup_old_sessions()
-                main_logger.info("Daily cleanup completed")
-            except Exception as e:
-                main_logger.error(f"Cleanup error: {e}")
-    
-    cleanup_thread = threading.Thread(target=cleanup_task, daemon=True)
-    cleanup_thread.start()
-    
+    # For several workers use gunicorn.conf.py, which shares one model copy between them
     main_logger.info("Starting PDF Chatbot server on port 8000")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
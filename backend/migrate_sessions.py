@@ -0,0 +1,47 @@
+"""Migrate legacy session files to the append-only history log format.
+
+Older session files in data/sessions/*.json keep the whole chat history
+inline. This moves each history into data/history/<session_id>.jsonl and
+rewrites the session file as a small metadata header. Sessions already
+in the new format are left alone, so it is safe to run repeatedly.
+
+    python migrate_sessions.py [--storage-dir data] [--dry-run]
+"""
+import argparse
+import json
+import os
+from persistent_storage import PersistentStorage
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate session files to the append-only history log")
+    parser.add_argument("--storage-dir", default="data")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be migrated")
+    args = parser.parse_args()
+
+    storage = PersistentStorage(args.storage_dir)
+    sessions_dir = f"{args.storage_dir}/sessions"
+    migrated = skipped = failed = 0
+
+    for filename in sorted(os.listdir(sessions_dir)):
+        if not filename.endswith('.json'):
+            continue
+        session_id = filename[:-5]
+        try:
+            if args.dry_run:
+                with open(os.path.join(sessions_dir, filename), 'r') as f:
+                    legacy = "chat_history" in json.load(f)
+                migrated += legacy
+                skipped += not legacy
+            elif storage.migrate_session(session_id):
+                migrated += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            failed += 1
+            print(f"Failed to migrate {session_id}: {e}")
+
+    action = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{action} {migrated} session(s), {skipped} already current, {failed} failed")
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,138 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
+from embeddings import get_embeddings, get_pipeline
+from embedding_cache import get_cache, sha256_text
+from index_factory import maybe_reindex
+from faiss_store import index_new_chunks
+from metrics import StageTimer
 
 load_dotenv()
 
+# Embedding batches buffered before chunks are embedded and added to the index
+EMBED_WINDOW_BATCHES = int(os.getenv("EMBED_WINDOW_BATCHES", "2"))
+
 class PDFProcessor:
+    # langchain's loaders and splitters take most of a second to import,
+    # so they are imported on first use rather than when the server starts
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+        self._text_splitter = None
+    
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+            )
+        return self._text_splitter
+    
+    @property
+    def embeddings(self):
+        """Shared process-wide embedding model"""
+        return get_embeddings()
     
-    def process_pdf(self, file_path: str):
+    def iter_chunks(self, file_path: str, timer: StageTimer = None):
+        """Yield (page_number, chunks) one page at a time without loading the whole PDF"""
+        from langchain_community.document_loaders import PyPDFLoader
+        timer = timer or StageTimer()
+        pages = PyPDFLoader(file_path).lazy_load()
+        page_number = 0
+        while True:
+            # Pages are parsed lazily, so parse time is the time to fetch the next one
+            with timer.stage("pdf_parse"):
+                page = next(pages, None)
+            if page is None:
+                return
+            page_number += 1
+            with timer.stage("pdf_split"):
+                chunks = self.text_splitter.split_documents([page])
+            yield page_number, chunks
+    
+    def process_pdf(self, file_path: str, progress=None, file_hash: str = None):
+        """Parse, split and embed a PDF into a new FAISS store, streaming page by page.
+
+        Chunks are embedded and added to the index in fixed-size windows as
+        pages are parsed, so peak memory does not grow with the page count.
+        When file_hash is given and those exact bytes were processed before,
+        the cached store is returned without parsing or embedding.
+        progress, if given, is called with keyword updates such as
+        pages_parsed, chunks_total and chunks_embedded as work completes.
+        """
+        report = progress or (lambda **kwargs: None)
+        cache = get_cache()
+        
+        if cache and file_hash:
+            vector_store = cache.get_file(file_hash)
+            if vector_store is not None:
+                os.remove(file_path)
+                report(chunks_total=vector_store.index.ntotal, chunks_embedded=vector_store.index.ntotal, cached=True)
+                return vector_store
+        
+        pipeline = get_pipeline()
+        embed = (lambda texts: cache.embed(texts, pipeline.embed)) if cache else pipeline.embed
+        window_size = pipeline.batch_size * EMBED_WINDOW_BATCHES
+        timer = StageTimer()
+        vector_store = None
+        window = []
+        seen_hashes = set()
+        pages_parsed = 0
+        chunks_embedded = 0
+        
+        from langchain_community.vectorstores import FAISS
+        
+        def flush_window():
+            nonlocal vector_store, chunks_embedded
+            contents = [doc.page_content for doc in window]
+            metadatas = [doc.metadata for doc in window]
+            with timer.stage("embed"):
+                vectors = embed(contents)
+            with timer.stage("index_build"):
+                if vector_store is None:
+                    start = 0
+                    vector_store = FAISS.from_embeddings(list(zip(contents, vectors)), self.embeddings, metadatas=metadatas)
+                else:
+                    start = vector_store.index.ntotal
+                    vector_store.add_embeddings(list(zip(contents, vectors)), metadatas=metadatas)
+                # Keyword index for hybrid retrieval, built alongside the vectors
+                index_new_chunks(vector_store, start, contents)
+            chunks_embedded += len(window)
+            window.clear()
+            report(chunks_embedded=chunks_embedded)
+        
         try:
-            # Load PDF
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
+            report(pages_total=self._count_pages(file_path))
+            
+            for pages_parsed, chunks in self.iter_chunks(file_path, timer):
+                for chunk in chunks:
+                    # Repeated chunks (boilerplate pages, headers) are indexed once
+                    chunk_hash = sha256_text(chunk.page_content)
+                    if chunk_hash in seen_hashes:
+                        continue
+                    seen_hashes.add(chunk_hash)
+                    chunk.metadata["chunk_hash"] = chunk_hash
+                    window.append(chunk)
+                report(pages_parsed=pages_parsed)
+                if len(window) >= window_size:
+                    flush_window()
             
-            if not documents:
+            if pages_parsed == 0:
                 raise ValueError("No content found in PDF")
             
-            # Split documents
-            texts = self.text_splitter.split_documents(documents)
+            if window:
+                flush_window()
             
-            if not texts:
+            if vector_store is None:
                 raise ValueError("No text chunks created from PDF")
+            # Built flat while streaming; very large documents switch to the configured type
+            with timer.stage("index_build"):
+                maybe_reindex(vector_store)
+            timer.observe()
+            report(chunks_total=chunks_embedded)
             
-            # Create vector store
-            vector_store = FAISS.from_documents(texts, self.embeddings)
+            if cache and file_hash:
+                cache.put_file(file_hash, vector_store, os.path.basename(file_path))
             
             # Clean up uploaded file
             os.remove(file_path)
@@ -45,4 +143,14 @@ class PDFProcessor:
             # Clean up file on error
             if os.path.exists(file_path):
                 os.remove(file_path)
-            raise e
\ No newline at end of file
+            raise e
+    
+    def _count_pages(self, file_path: str):
+        """Page count from the PDF's page tree (no text extraction), or None"""
+        try:
+            from pypdf import PdfReader
+            # A file handle keeps pypdf reading on demand instead of slurping the file
+            with open(file_path, "rb") as f:
+                return len(PdfReader(f).pages)
+        except Exception:
+            return None
\ No newline at end of file
@@ -1,75 +1,267 @@
+import contextlib
 import os
+from abc import ABC, abstractmethod
 import json
-import pickle
+import itertools
 import shutil
 from typing import Dict, List, Optional
 import time
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from faiss_store import load_faiss_store, save_faiss_store
+from shared_index import VECTOR_STORAGE_MODE, SharedVectorIndex
+from metrics import span, timed
+from worker_sync import MULTI_WORKER, StripedFileLock
 
-class PersistentStorage:
+# Session files are a small metadata header; the chat history lives in an
+# append-only JSONL log next to it (one message per line)
+HISTORY_FORMAT_VERSION = 2
+
+# "file" (JSON header + JSONL log per session) or "sqlite"
+STORAGE_BACKEND = os.getenv("SESSION_STORAGE_BACKEND", "file")
+
+class SessionStore(ABC):
+    """Interface shared by the session storage backends.
+
+    Backends persist session metadata and chat history; vector stores are
+    kept as FAISS folders under <storage_dir>/vectors by every backend and
+    are only loaded when first searched (see session_manager.get_vector_store).
+    With VECTOR_STORAGE_MODE=shared all sessions share one sharded index
+    under <storage_dir>/vectors/shared instead.
+    
+    Every save stores the session's "version" counter, which other worker
+    processes compare against their cached copy (see session_version).
+    Backends must implement every abstract method to be instantiated.
+    """
+    
     def __init__(self, storage_dir="data"):
         self.storage_dir = storage_dir
         os.makedirs(storage_dir, exist_ok=True)
-        os.makedirs(f"{storage_dir}/sessions", exist_ok=True)
         os.makedirs(f"{storage_dir}/vectors", exist_ok=True)
+        self.vector_index = SharedVectorIndex(f"{storage_dir}/vectors/shared") if VECTOR_STORAGE_MODE == "shared" else None
+        self._locks = StripedFileLock(f"{storage_dir}/locks") if MULTI_WORKER else None
+    
+    def session_lock(self, session_id: str):
+        """Cross-process lock for a session's read-modify-write (a no-op with a single worker)"""
+        return self._locks.hold(session_id) if self._locks is not None else contextlib.nullcontext()
+    
+    @abstractmethod
+    def session_version(self, session_id: str) -> Optional[int]:
+        """Version of the stored session, or None if it does not exist"""
+        raise NotImplementedError
+    
+    @abstractmethod
+    def save_session(self, session_id: str, session_data: dict, save_vectors: bool = True):
+        raise NotImplementedError
+    
+    @abstractmethod
+    def load_session(self, session_id: str) -> Optional[dict]:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def load_metadata(self, session_id: str) -> Optional[dict]:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def load_history(self, session_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def session_exists(self, session_id: str) -> bool:
+        raise NotImplementedError
+    
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        raise NotImplementedError
+    
+    @abstractmethod
+    def cleanup_old_sessions(self, max_age_days=7):
+        raise NotImplementedError
+    
+    @staticmethod
+    def _has_vectors(session_data: dict) -> bool:
+        # A session whose vectors were never loaded still has them on disk
+        return session_data.get("vector_store") is not None or bool(session_data.get("has_vector_store"))
+    
+    def _vector_path(self, session_id: str) -> str:
+        return f"{self.storage_dir}/vectors/{session_id}"
+    
+    @timed("vector_save")
+    def save_vectors(self, session_id: str, vector_store):
+        """Write a session's vector store to disk"""
+        if self.vector_index is not None:
+            # Chunks are already in the shared index's database; shard files follow on an interval
+            self.vector_index.save()
+            return
+        try:
+            save_faiss_store(vector_store, self._vector_path(session_id))
+        except Exception as e:
+            pass
+    
+    @timed("vector_load")
+    def load_vectors(self, session_id: str):
+        """Load a session's vector store, or None if missing or unreadable"""
+        if self.vector_index is not None:
+            return self.vector_index.view(session_id) if self.vector_index.has_session(session_id) else None
+        vector_path = self._vector_path(session_id)
+        if not os.path.exists(vector_path):
+            return None
+        try:
+            return load_faiss_store(vector_path)
+        except Exception as e:
+            return None
+    
+    def delete_vectors(self, session_id: str):
+        if self.vector_index is not None:
+            self.vector_index.delete_session(session_id)
+        vector_path = self._vector_path(session_id)
+        if os.path.exists(vector_path):
+            shutil.rmtree(vector_path)
+
+class PersistentStorage(SessionStore):
+    """File backend: one JSON header and one JSONL history log per session"""
+    
+    def __init__(self, storage_dir="data"):
+        super().__init__(storage_dir)
+        os.makedirs(f"{storage_dir}/sessions", exist_ok=True)
+        os.makedirs(f"{storage_dir}/history", exist_ok=True)
+        # Messages already in each session's log, so saves only append the new ones
+        self._logged_counts = {}
     
-    def save_session(self, session_id: str, session_data: dict):
-        """Save session data to file"""
-        session_file = f"{self.storage_dir}/sessions/{session_id}.json"
+    def _session_file(self, session_id: str) -> str:
+        return f"{self.storage_dir}/sessions/{session_id}.json"
+    
+    def _history_file(self, session_id: str) -> str:
+        return f"{self.storage_dir}/history/{session_id}.jsonl"
+    
+    def _read_header(self, session_id: str) -> Optional[dict]:
+        session_file = self._session_file(session_id)
+        if not os.path.exists(session_file):
+            return None
+        with open(session_file, 'r') as f:
+            return json.load(f)
+    
+    def _write_header(self, session_id: str, header: dict):
+        # Write to a temp file and swap it in so a crash never leaves a torn header
+        session_file = self._session_file(session_id)
+        tmp_file = f"{session_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(header, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, session_file)
+    
+    def _logged_count(self, session_id: str) -> int:
+        if session_id not in self._logged_counts:
+            header = self._read_header(session_id) or {}
+            # Legacy files keep the history inline and have nothing in the log yet
+            self._logged_counts[session_id] = header.get("message_count", 0) if "chat_history" not in header else 0
+        return self._logged_counts[session_id]
+    
+    def append_messages(self, session_id: str, messages: List[dict]):
+        """Append messages to the session's history log"""
+        if not messages:
+            return
+        lines = "".join(json.dumps(msg, separators=(",", ":")) + "\n" for msg in messages)
+        with open(self._history_file(session_id), 'a') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._logged_counts[session_id] = self._logged_count(session_id) + len(messages)
+    
+    def save_session(self, session_id: str, session_data: dict, save_vectors: bool = True):
+        """Save session data to file; save_vectors=False skips rewriting the vector store"""
+        # Vectors go first, so a header never announces a version whose vectors are not on disk yet
+        if save_vectors and session_data.get("vector_store"):
+            self.save_vectors(session_id, session_data["vector_store"])
         
-        # Prepare data for JSON (exclude vector_store)
-        json_data = {
-            "session_id": session_id,
-            "filename": session_data.get("filename", ""),
-            "chat_history": session_data.get("chat_history", []),
-            "created_at": session_data.get("created_at", time.time()),
-            "last_activity": time.time(),
-            "has_vector_store": session_data.get("vector_store") is not None
-        }
+        # Vector writes are timed separately as vector_save
+        with span("session_save"):
+            chat_history = session_data.get("chat_history", [])
         
-        with open(session_file, 'w') as f:
-            json.dump(json_data, f, indent=2)
+            # Only messages added since the last save are written
+            logged = self._logged_count(session_id)
+            if logged > len(chat_history):
+                # History was replaced wholesale; start the log over
+                if os.path.exists(self._history_file(session_id)):
+                    os.remove(self._history_file(session_id))
+                self._logged_counts[session_id] = logged = 0
+            self.append_messages(session_id, chat_history[logged:])
         
-        # Save vector store separately if exists
-        if session_data.get("vector_store"):
-            vector_path = f"{self.storage_dir}/vectors/{session_id}"
-            try:
-                session_data["vector_store"].save_local(vector_path)
-            except Exception as e:
-                pass
+            # Header excludes the history and the vector_store
+            header = {
+                "session_id": session_id,
+                "filename": session_data.get("filename", ""),
+                "created_at": session_data.get("created_at", time.time()),
+                "last_activity": session_data.get("last_activity", time.time()),
+                "has_vector_store": self._has_vectors(session_data),
+                "message_count": len(chat_history),
+                "profile": session_data.get("profile") or {},
+                "summary": session_data.get("summary"),
+                "version": session_data.get("version", 0),
+                "format_version": HISTORY_FORMAT_VERSION
+            }
+            self._write_header(session_id, header)
     
-    def load_session(self, session_id: str) -> Optional[dict]:
-        """Load session data from file"""
-        session_file = f"{self.storage_dir}/sessions/{session_id}.json"
-        
-        if not os.path.exists(session_file):
+    def load_metadata(self, session_id: str) -> Optional[dict]:
+        """Load the session header without its history or vectors"""
+        try:
+            header = self._read_header(session_id)
+        except Exception as e:
+            return None
+        if header is None:
             return None
+        if "chat_history" in header:
+            # Legacy inline history
+            header["message_count"] = len(header.pop("chat_history"))
+        return header
+    
+    def load_history(self, session_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Read a page of chat history, parsing only the requested lines"""
+        history_file = self._history_file(session_id)
+        if not os.path.exists(history_file):
+            header = self._read_header(session_id) or {}
+            history = header.get("chat_history", [])
+            return history[offset:offset + limit] if limit is not None else history[offset:]
         
+        stop = offset + limit if limit is not None else None
+        messages = []
+        with open(history_file, 'r') as f:
+            for line in itertools.islice(f, offset, stop):
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn final line from a crash mid-append
+                    continue
+        return messages
+    
+    @timed("session_load")
+    def load_session(self, session_id: str) -> Optional[dict]:
+        """Load session data from file"""
         try:
-            with open(session_file, 'r') as f:
-                json_data = json.load(f)
+            json_data = self._read_header(session_id)
+            if json_data is None:
+                return None
+            
+            if "chat_history" in json_data:
+                chat_history = json_data["chat_history"]
+                self._logged_counts[session_id] = 0
+            else:
+                chat_history = self.load_history(session_id)
+                self._logged_counts[session_id] = len(chat_history)
             
             session_data = {
                 "session_id": json_data["session_id"],
                 "filename": json_data["filename"],
-                "chat_history": json_data["chat_history"],
+                "chat_history": chat_history,
                 "created_at": json_data["created_at"],
                 "last_activity": json_data["last_activity"],
-                "vector_store": None
+                "profile": json_data.get("profile"),
+                "summary": json_data.get("summary"),
+                "version": json_data.get("version", 0),
+                # Attached on first search by session_manager.get_vector_store
+                "vector_store": None,
+                "has_vector_store": bool(json_data.get("has_vector_store"))
             }
             
-            # Load vector store if exists
-            if json_data.get("has_vector_store"):
-                vector_path = f"{self.storage_dir}/vectors/{session_id}"
-                if os.path.exists(vector_path):
-                    try:
-                        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-                        vector_store = FAISS.load_local(vector_path, embeddings, allow_dangerous_deserialization=True)
-                        session_data["vector_store"] = vector_store
-                    except Exception as e:
-                        pass
-            
             return session_data
             
         except Exception as e:
@@ -77,35 +269,66 @@ class PersistentStorage:
     
     def session_exists(self, session_id: str) -> bool:
         """Check if session exists"""
-        session_file = f"{self.storage_dir}/sessions/{session_id}.json"
-        return os.path.exists(session_file)
+        return os.path.exists(self._session_file(session_id))
+    
+    def session_version(self, session_id: str) -> Optional[int]:
+        """Version from the session header, or None if it does not exist"""
+        try:
+            header = self._read_header(session_id)
+        except (OSError, ValueError):
+            return None
+        return header.get("version", 0) if header is not None else None
+    
+    def migrate_session(self, session_id: str) -> bool:
+        """Move a legacy inline chat_history into the append-only log"""
+        header = self._read_header(session_id)
+        if header is None or "chat_history" not in header:
+            return False
+        
+        history_file = self._history_file(session_id)
+        if os.path.exists(history_file):
+            os.remove(history_file)
+        self._logged_counts[session_id] = 0
+        self.append_messages(session_id, header.pop("chat_history"))
+        header["message_count"] = self._logged_counts[session_id]
+        header["format_version"] = HISTORY_FORMAT_VERSION
+        self._write_header(session_id, header)
+        return True
+    
+    def delete_session(self, session_id: str):
+        """Delete a session file, its history log and its vector store"""
+        self._logged_counts.pop(session_id, None)
+        for path in (self._session_file(session_id), self._history_file(session_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self.delete_vectors(session_id)
     
     def cleanup_old_sessions(self, max_age_days=7):
         """Clean up sessions older than max_age_days"""
         sessions_dir = f"{self.storage_dir}/sessions"
-        vectors_dir = f"{self.storage_dir}/vectors"
         current_time = time.time()
         max_age_seconds = max_age_days * 24 * 60 * 60
         
         for filename in os.listdir(sessions_dir):
             if filename.endswith('.json'):
                 session_id = filename[:-5]  # Remove .json
-                session_file = os.path.join(sessions_dir, filename)
                 
                 try:
-                    with open(session_file, 'r') as f:
-                        data = json.load(f)
+                    data = self._read_header(session_id)
                     
                     if current_time - data.get("last_activity", 0) > max_age_seconds:
-                        # Remove session file
-                        os.remove(session_file)
-                        
-                        # Remove vector store if exists
-                        vector_path = os.path.join(vectors_dir, session_id)
-                        if os.path.exists(vector_path):
-                            shutil.rmtree(vector_path)
-                        
-                        pass
+                        # Remove session header, history log and vector store
+                        self.delete_session(session_id)
                         
                 except Exception as e:
-                    pass
\ No newline at end of file
+                    pass
+
+def create_storage(backend: str = None, storage_dir: str = "data") -> SessionStore:
+    """Build the configured session storage backend"""
+    backend = backend or STORAGE_BACKEND
+    if backend == "file":
+        return PersistentStorage(storage_dir)
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(storage_dir)
+    raise ValueError(f"Unknown session storage backend: {backend}")
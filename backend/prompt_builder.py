@@ -0,0 +1,120 @@
+import math
+import os
+from typing import List, Optional
+
+# Prompt size limit, leaving the rest of the model context for the answer
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1000"))
+# Rough characters per token for English text with Mistral/Llama tokenizers
+CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+# Messages kept verbatim; older ones are folded into the rolling summary
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+# Unsummarized older messages that trigger a summary update
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "6"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+
+def count_tokens(text: str) -> int:
+    """Approximate token count; Ollama does not expose its tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to roughly tokens tokens, at a word boundary where possible"""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > limit // 2 else cut) + "..."
+
+def format_turn(msg: dict) -> str:
+    return f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
+
+class PromptBuilder:
+    """Assembles LLM prompts within a token budget.
+
+    The question is always included; retrieved chunks come next in rank
+    order, then the most recent turns newest first, then the rolling
+    summary of older conversation. Whatever does not fit is truncated or
+    dropped.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET):
+        self.budget = budget
+
+    def general_prompt(self, question: str, recent: List[dict], summary: str = "") -> str:
+        question = truncate_to_tokens(question, self.budget // 2)
+        remaining = self.budget - count_tokens(question) - 10
+        turns, remaining = self._fit_turns(recent, remaining)
+        summary_text = self._fit_summary(summary, remaining)
+
+        sections = []
+        if summary_text:
+            sections.append(f"Summary of earlier conversation:\n{summary_text}")
+        if turns:
+            sections.append("Previous conversation:\n" + "\n".join(turns))
+        sections.append(f"User: {question}\n\nAssistant:")
+        return "\n\n".join(sections)
+
+    def document_prompt(self, question: str, chunks: List[str], doc_names: str,
+                        recent: Optional[List[dict]] = None, summary: str = "") -> str:
+        question = truncate_to_tokens(question, self.budget // 4)
+        header = f"Context from {doc_names}:\n"
+        footer = f"\n\nQuestion: {question}\n\nAnswer based on the documents (mention which document if relevant):"
+        remaining = self.budget - count_tokens(header) - count_tokens(footer)
+
+        excerpts = []
+        for i, chunk in enumerate(chunks):
+            label = f"Document excerpt {i+1}: "
+            available = remaining - count_tokens(label)
+            if available <= 20:
+                break
+            text = truncate_to_tokens(chunk, available)
+            excerpts.append(label + text)
+            remaining -= count_tokens(label + text) + 1
+
+        turns, remaining = self._fit_turns(recent or [], remaining)
+        summary_text = self._fit_summary(summary, remaining)
+
+        conversation = []
+        if summary_text:
+            conversation.append(f"Summary of earlier conversation:\n{summary_text}")
+        if turns:
+            conversation.append("Previous conversation:\n" + "\n".join(turns))
+        prefix = "\n\n".join(conversation) + "\n\n" if conversation else ""
+        return prefix + header + "\n\n".join(excerpts) + footer
+
+    def summary_prompt(self, summary_text: str, messages: List[dict]) -> str:
+        """Prompt asking the LLM to fold messages into the running summary"""
+        # The summary update must fit the budget too; oldest messages give way first
+        remaining = self.budget - count_tokens(summary_text) - 60
+        lines = []
+        for msg in reversed(messages):
+            line = truncate_to_tokens(format_turn(msg), max(20, remaining // 2))
+            if count_tokens(line) > remaining:
+                break
+            lines.append(line)
+            remaining -= count_tokens(line) + 1
+        lines.reverse()
+        previous = f"Current summary:\n{summary_text}\n\n" if summary_text else ""
+        return (
+            f"{previous}New conversation lines:\n" + "\n".join(lines) +
+            f"\n\nWrite an updated summary of the conversation in at most {SUMMARY_MAX_TOKENS * 3 // 4} words. "
+            "Keep facts the user stated about themselves and open questions.\n\nSummary:"
+        )
+
+    def _fit_turns(self, recent: List[dict], remaining: int):
+        """The newest of the recent turns that fit in remaining tokens"""
+        turns = []
+        for msg in reversed(recent):
+            line = format_turn(msg)
+            cost = count_tokens(line) + 1
+            if cost > remaining:
+                break
+            turns.append(line)
+            remaining -= cost
+        turns.reverse()
+        return turns, remaining
+
+    def _fit_summary(self, summary: str, remaining: int) -> str:
+        if not summary or remaining < 30:
+            return ""
+        return truncate_to_tokens(summary, remaining - 10)
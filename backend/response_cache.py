@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from faiss_store import iter_chunk_hashes
+from shared_index import SessionVectorView
+
+# Cosine similarity a new question needs to reuse a cached answer
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+def document_fingerprint(vector_store) -> str:
+    """Identify the set of chunks in a vector store (order independent)"""
+    shared = isinstance(vector_store, SessionVectorView)
+    ntotal = vector_store.ntotal if shared else vector_store.index.ntotal
+    cached = getattr(vector_store, "_cache_fingerprint", None)
+    # Stores only ever grow, so the vector count tells us when to recompute
+    if cached and cached[0] == ntotal:
+        return cached[1]
+    digest = hashlib.sha256()
+    for chunk_hash in sorted(vector_store.chunk_hashes() if shared else iter_chunk_hashes(vector_store)):
+        digest.update(chunk_hash.encode("utf-8"))
+    fingerprint = digest.hexdigest()
+    vector_store._cache_fingerprint = (ntotal, fingerprint)
+    return fingerprint
+
+def answer_key(fingerprint: str, recent=None, summary: str = "") -> str:
+    """Cache key for an answer: the document fingerprint, narrowed by any conversation in the prompt"""
+    if not recent and not summary:
+        # Context-free answers depend only on the documents and may be shared across sessions
+        return fingerprint
+    digest = hashlib.sha256(fingerprint.encode("utf-8"))
+    digest.update((summary or "").encode("utf-8"))
+    for message in recent or []:
+        digest.update(f"\0{message['role']}\0{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+class SemanticResponseCache:
+    """Answers to document questions, reused for near-identical questions.
+
+    Entries are keyed by answer_key and matched on the cosine similarity
+    of the question embeddings, so sessions holding the same documents
+    share answers given without conversation context. Entries expire after ttl seconds and the
+    least recently used are dropped beyond max_entries.
+    """
+
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # fingerprint -> {entry id: (unit query vector, answer, created_at)}
+        self._by_document = {}
+        # (fingerprint, entry id) in least-recently-used order, for eviction
+        self._order = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, fingerprint: str, query_vector):
+        """Cached answer for the closest earlier question, if similar enough"""
+        query = self._unit(query_vector)
+        now = time.time()
+        with self._lock:
+            entries = self._by_document.get(fingerprint, {})
+            for entry_id in [i for i, (_, _, created_at) in entries.items() if now - created_at > self.ttl]:
+                self._remove(fingerprint, entry_id)
+            if not entries:
+                self.misses += 1
+                return None
+
+            ids = list(entries)
+            scores = np.stack([entries[i][0] for i in ids]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._order.move_to_end((fingerprint, ids[best]))
+            return entries[ids[best]][1]
+
+    def put(self, fingerprint: str, query_vector, answer: str):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._by_document.setdefault(fingerprint, {})[entry_id] = (self._unit(query_vector), answer, time.time())
+            self._order[(fingerprint, entry_id)] = None
+            while len(self._order) > self.max_entries:
+                self._remove(*next(iter(self._order)))
+                self.evictions += 1
+
+    def _remove(self, fingerprint: str, entry_id: int):
+        """Drop one entry; caller holds the lock"""
+        self._order.pop((fingerprint, entry_id), None)
+        entries = self._by_document.get(fingerprint)
+        if entries is not None:
+            entries.pop(entry_id, None)
+            if not entries:
+                del self._by_document[fingerprint]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._order),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
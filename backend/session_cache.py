@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from logger import session_logger
+
+# Limits for resident sessions; 0 disables a limit
+MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "1000"))
+IDLE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_IDLE_TTL", "3600"))
+MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", "0"))
+
+# Rough per-message overhead of the dict, keys and timestamp
+MESSAGE_OVERHEAD_BYTES = 200
+
+def estimate_session_bytes(session: dict) -> int:
+    """Approximate memory held by a session: float32 vectors plus chat history"""
+    size = 0
+    vector_store = session.get("vector_store")
+    index = getattr(vector_store, "index", None)
+    if index is not None:
+        # Memory-mapped indexes live in the shared page cache, not the heap
+        if not getattr(vector_store, "_mmapped", False):
+            size += index.ntotal * index.d * 4
+        # Stored chunk text, unless the docstore keeps it on disk
+        docs = getattr(getattr(vector_store, "docstore", None), "_dict", {})
+        size += sum(len(doc.page_content) for doc in docs.values())
+    for msg in session.get("chat_history", []):
+        size += len(msg.get("content", "")) + MESSAGE_OVERHEAD_BYTES
+    return size
+
+class SessionCache:
+    """LRU cache of resident sessions with idle TTL and an optional memory budget.
+
+    Entries are ordered by last access. Expired or over-budget sessions are
+    dropped from the least recently used end and handed to on_evict (used
+    to flush pending writes) after they leave the cache.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = IDLE_TTL_SECONDS,
+                 max_bytes: int = MAX_BYTES, on_evict=None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()  # session_id -> session
+        self._sizes = {}
+        self._last_access = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, session_id: str) -> dict:
+        with self._lock:
+            session = self._entries[session_id]
+            self._touch(session_id)
+            return session
+
+    def __setitem__(self, session_id: str, session: dict):
+        with self._lock:
+            if session_id in self._entries:
+                self._total_bytes -= self._sizes[session_id]
+            self._entries[session_id] = session
+            self._sizes[session_id] = estimate_session_bytes(session)
+            self._total_bytes += self._sizes[session_id]
+            self._touch(session_id)
+            evicted = self._evict(protect=session_id)
+        self._notify(evicted)
+
+    def __delitem__(self, session_id: str):
+        """Remove without calling on_evict (the session is being deleted)"""
+        with self._lock:
+            del self._entries[session_id]
+            self._last_access.pop(session_id, None)
+            self._total_bytes -= self._sizes.pop(session_id, 0)
+
+    def get(self, session_id: str):
+        """Look up a session, counting the hit or miss; expired entries count as misses"""
+        evicted = []
+        with self._lock:
+            session = self._entries.get(session_id)
+            if session is not None and self._expired(session_id, time.time()):
+                evicted = self._evict()
+                session = self._entries.get(session_id)
+            if session is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._touch(session_id)
+        self._notify(evicted)
+        return session
+
+    def peek(self, session_id: str):
+        """Look up a session without counting it or refreshing its recency"""
+        with self._lock:
+            return self._entries.get(session_id)
+
+    def sessions(self) -> list:
+        """Snapshot of the resident sessions, without touching them"""
+        with self._lock:
+            return list(self._entries.values())
+
+    def touch(self, session_id: str, added_bytes: int = 0):
+        """Mark a session used and account for data appended to it in place"""
+        with self._lock:
+            if session_id not in self._entries:
+                return
+            self._sizes[session_id] += added_bytes
+            self._total_bytes += added_bytes
+            self._touch(session_id)
+            evicted = self._evict(protect=session_id)
+        self._notify(evicted)
+
+    def resize(self, session_id: str):
+        """Re-estimate a session's size after its vector store changed"""
+        session = self._entries.get(session_id)
+        if session is not None:
+            self[session_id] = session
+
+    def evict_expired(self) -> int:
+        """Drop idle sessions past the TTL; returns how many were evicted"""
+        with self._lock:
+            evicted = self._evict()
+        self._notify(evicted)
+        return len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident_sessions": len(self._entries),
+                "estimated_bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": dict(self.evictions),
+                "evictions_total": sum(self.evictions.values())
+            }
+
+    def _touch(self, session_id: str):
+        self._entries.move_to_end(session_id)
+        self._last_access[session_id] = time.time()
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return self.idle_ttl > 0 and now - self._last_access[session_id] > self.idle_ttl
+
+    def _evict(self, protect: str = None) -> list:
+        """Pop entries from the LRU end while limits are exceeded; caller holds the lock"""
+        evicted = []
+        now = time.time()
+        while self._entries:
+            session_id = next(iter(self._entries))
+            if session_id == protect:
+                # The protected entry was just touched; reaching it means nothing older is left
+                break
+            if self._expired(session_id, now):
+                reason = "ttl"
+            elif self.max_sessions > 0 and len(self._entries) > self.max_sessions:
+                reason = "lru"
+            elif self.max_bytes > 0 and self._total_bytes > self.max_bytes:
+                reason = "memory"
+            else:
+                # Ordered by last access: nothing further along is idle for longer
+                break
+            session = self._entries.pop(session_id)
+            self._last_access.pop(session_id, None)
+            self._total_bytes -= self._sizes.pop(session_id, 0)
+            self.evictions[reason] += 1
+            evicted.append((session_id, session, reason))
+        return evicted
+
+    def _notify(self, evicted: list):
+        for session_id, session, reason in evicted:
+            session_logger.info(f"Evicted session {session_id[:8]}... from memory ({reason})")
+            if self.on_evict:
+                try:
+                    self.on_evict(session_id, session)
+                except Exception as e:
+                    session_logger.error(f"Eviction callback failed for {session_id[:8]}...: {e}")
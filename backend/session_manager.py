@@ -1,22 +1,76 @@
-from persistent_storage import PersistentStorage
+from persistent_storage import create_storage
+import threading
 import time
-import os
-import shutil
 from logger import session_logger, storage_logger
-from langchain_community.vectorstores import FAISS
+from write_behind import WriteBehindWriter
+from worker_sync import MULTI_WORKER, LeaderLock
+from session_cache import SessionCache, MESSAGE_OVERHEAD_BYTES
+from faiss_store import (
+    SQLiteDocstore, chunk_hash, commit_staged, index_new_chunks, iter_chunk_hashes, staged_copy
+)
+from index_factory import index_type, maybe_reindex
+from user_profile import build_profile, update_profile
 
-# Initialize persistent storage
-storage = PersistentStorage()
+# Initialize persistent storage (file or SQLite, see SESSION_STORAGE_BACKEND)
+storage = create_storage()
 
-# In-memory cache for active sessions
-active_sessions = {}
+if MULTI_WORKER and storage.vector_index is not None:
+    raise RuntimeError("VECTOR_STORAGE_MODE=shared keeps its shards in one process and cannot run with SESSION_MULTI_WORKER=1")
+
+# Batches session saves on a background thread instead of writing on every change.
+# With several workers every change is written through while the session's
+# cross-process lock is held, so no worker saves over another's newer version.
+persistence = WriteBehindWriter(storage, flush_interval=0) if MULTI_WORKER else WriteBehindWriter(storage)
+persistence.start()
+
+# Serializes uploads into the same session; the merge itself runs outside the vector lock
+_ingest_locks = {}
+_ingest_locks_guard = threading.Lock()
+
+# Only one worker process deletes expired sessions from storage
+cleanup_leader = LeaderLock(f"{storage.storage_dir}/cleanup.lock")
+
+def _flush_evicted(session_id: str, session: dict):
+    # Pending writes must reach disk before the session can be reloaded from it
+    persistence.flush(session_id)
+
+# In-memory cache for active sessions, bounded by count, idle time and memory
+active_sessions = SessionCache(on_evict=_flush_evicted)
+
+def _save(session_id: str, session: dict, vectors: bool = False):
+    """Queue a session for saving; in multi-worker mode the caller holds storage.session_lock"""
+    if MULTI_WORKER:
+        # Other workers see the new version and reload their cached copy
+        session["version"] = session.get("version", 0) + 1
+    persistence.mark_dirty(session_id, session, vectors=vectors)
+
+def _adopt_vectors(session_id: str, vector_store):
+    """In shared mode, move a freshly built store into the shared index and return the session's view"""
+    if vector_store is None or storage.vector_index is None:
+        return vector_store
+    storage.vector_index.add_store(session_id, vector_store)
+    return storage.vector_index.view(session_id)
 
 def create_session(session_id: str, vector_store, filename: str):
+    with storage.session_lock(session_id):
+        if MULTI_WORKER and vector_store is None:
+            # Another worker may have created it since the caller looked
+            existing = get_session(session_id)
+            if existing is not None:
+                return existing
+        return _create_session(session_id, vector_store, filename)
+
+def _create_session(session_id: str, vector_store, filename: str):
+    vector_store = _adopt_vectors(session_id, vector_store)
     session_data = {
         "session_id": session_id,
         "vector_store": vector_store,
+        "has_vector_store": vector_store is not None,
         "filename": filename or "General Chat",
         "chat_history": [],
+        "profile": {},
+        "summary": None,
+        "version": 0,
         "created_at": time.time(),
         "last_activity": time.time()
     }
@@ -24,81 +78,189 @@ def create_session(session_id: str, vector_store, filename: str):
     # Cache in memory
     active_sessions[session_id] = session_data
     
-    # Save to disk
-    storage.save_session(session_id, session_data)
+    # Queue for saving to disk
+    _save(session_id, session_data, vectors=vector_store is not None)
     
     session_logger.info(f"Session created: {session_id[:8]}...")
     return session_data
 
+def append_new_chunks(target, source):
+    """Add source's vectors and chunks not already in target; returns their texts in position order.
+
+    Target's BM25 index is left alone (see index_new_chunks).
+    """
+    if target.index.d != source.index.d:
+        raise ValueError(f"Embedding dimension mismatch: {target.index.d} != {source.index.d}")
+    
+    seen = set(iter_chunk_hashes(target))
+    keep = []
+    for position, doc_id in sorted(source.index_to_docstore_id.items()):
+        doc = source.docstore.search(doc_id)
+        doc_hash = chunk_hash(doc)
+        if doc_hash not in seen:
+            seen.add(doc_hash)
+            keep.append((position, doc))
+    
+    start = target.index.ntotal
+    if len(keep) == source.index.ntotal and index_type(target.index) == index_type(source.index) == "flat":
+        # FAISS.merge_from copies the raw vectors index-to-index and re-keys the docstore
+        target.merge_from(source)
+    elif keep:
+        # Copy only the vectors of the chunks being kept
+        target.add_embeddings(
+            [(doc.page_content, source.index.reconstruct(position).tolist()) for position, doc in keep],
+            metadatas=[doc.metadata for _, doc in keep]
+        )
+    return [doc.page_content for _, doc in keep]
+
+def vector_lock(session_id: str):
+    """Lock to hold while searching or mutating a session's vector store"""
+    return persistence.session_lock(session_id)
+
+def get_vector_store(session: dict):
+    """A session's vector store, read from disk on first use"""
+    if session.get("vector_store") is None and session.get("has_vector_store"):
+        session_id = session["session_id"]
+        # Loading prunes chunks beyond the saved index, so it must not run while an upload
+        # has added chunks but not saved them (see _update_session_with_pdf)
+        with storage.session_lock(session_id), vector_lock(session_id):
+            if session.get("vector_store") is None:
+                # A save queued from another copy of this session (e.g. one evicted mid-upload) lands first
+                persistence.flush(session_id)
+                session["vector_store"] = storage.load_vectors(session_id)
+                # Missing or unreadable vectors: carry on as a chat-only session
+                session["has_vector_store"] = session["vector_store"] is not None
+                session_logger.info(f"Attached vector store for session {session_id[:8]}...")
+        active_sessions.resize(session_id)
+    return session.get("vector_store")
+
 def update_session_with_pdf(session_id: str, vector_store, filename: str):
     """Update existing session with PDF data, preserving chat history"""
+    # Held across the merge so another worker's upload cannot interleave with it
+    with storage.session_lock(session_id):
+        return _update_session_with_pdf(session_id, vector_store, filename)
+
+def _update_session_with_pdf(session_id: str, vector_store, filename: str):
     session_logger.info(f"Updating session {session_id[:8]}... with PDF: {filename}")
     session = get_session(session_id)
     session_logger.info(f"Found existing session: {session is not None}")
     
     if session:
-        # Merge with existing vector store if present
-        if session.get("vector_store"):
-            try:
-                # Get all documents from both vector stores
-                existing_docs = [session["vector_store"].docstore._dict[doc_id] for doc_id in session["vector_store"].docstore._dict]
-                new_docs = [vector_store.docstore._dict[doc_id] for doc_id in vector_store.docstore._dict]
-                all_docs = existing_docs + new_docs
+        # One ingestion at a time per session; searches only wait for the final swap
+        with _ingest_lock(session_id):
+            merge = None
+            if storage.vector_index is None and get_vector_store(session):
+                merge = _stage_merge(session_id, session["vector_store"], vector_store)
+            # Swapped in and queued for saving under one hold of the vector lock, so a
+            # reload of the session (see get_vector_store) never sees new chunks without their index
+            with persistence.session_lock(session_id):
+                if merge is not None:
+                    _commit_merge(session_id, session["vector_store"], *merge)
+                elif storage.vector_index is not None:
+                    # Shared index: link the chunks to this session; shared vectors are stored once
+                    added = storage.vector_index.add_store(session_id, vector_store)
+                    session["vector_store"] = storage.vector_index.view(session_id)
+                    session_logger.info(f"Added {added} chunks to shared index for session {session_id[:8]}...")
+                else:
+                    session["vector_store"] = vector_store
+                session["has_vector_store"] = True
+                _add_filename(session, filename)
+                session["last_activity"] = time.time()
                 
-                # Create new merged vector store
-                embeddings = vector_store.embeddings
-                session["vector_store"] = FAISS.from_documents(all_docs, embeddings)
-                session_logger.info(f"Merged vector store for session {session_id[:8]}...")
-            except Exception as e:
-                # If merge fails, replace (fallback)
-                session["vector_store"] = vector_store
-                session_logger.warning(f"Vector merge failed, replaced for session {session_id[:8]}... Error: {e}")
-        else:
-            session["vector_store"] = vector_store
-        
-        # Update filename to show multiple documents (avoid duplicates)
-        old_filename = session.get("filename", "")
-        if old_filename and old_filename != "General Chat":
-            # Split existing filenames and create a set to avoid duplicates
-            existing_files = set(f.strip() for f in old_filename.split(","))
-            if filename not in existing_files:
-                existing_files.add(filename)
-                session["filename"] = ", ".join(sorted(existing_files))
-                session_logger.info(f"Updated filename: {session['filename']}")
-            else:
-                session_logger.info(f"Filename already exists: {filename}")
-        else:
-            session["filename"] = filename
-            session_logger.info(f"Set new filename: {filename}")
-            
-        session["last_activity"] = time.time()
+                # Queue for saving to disk, including the changed vectors
+                _save(session_id, session, vectors=True)
         
         # Update cache
         active_sessions[session_id] = session
         
-        # Save to disk
-        storage.save_session(session_id, session)
-        
         return session
     else:
         # Create new session if none exists
         return create_session(session_id, vector_store, filename)
 
+def _ingest_lock(session_id: str) -> threading.Lock:
+    with _ingest_locks_guard:
+        if session_id not in _ingest_locks:
+            _ingest_locks[session_id] = threading.Lock()
+        return _ingest_locks[session_id]
+
+def _add_filename(session: dict, filename: str):
+    # Update filename to show multiple documents (avoid duplicates)
+    old_filename = session.get("filename", "")
+    if old_filename and old_filename != "General Chat":
+        # Split existing filenames and create a set to avoid duplicates
+        existing_files = set(f.strip() for f in old_filename.split(","))
+        if filename not in existing_files:
+            existing_files.add(filename)
+            session["filename"] = ", ".join(sorted(existing_files))
+            session_logger.info(f"Updated filename: {session['filename']}")
+        else:
+            session_logger.info(f"Filename already exists: {filename}")
+    else:
+        session["filename"] = filename
+        session_logger.info(f"Set new filename: {filename}")
+
+def _stage_merge(session_id: str, live, vector_store):
+    """Merge into a copy of the session's store without the vector lock; returns what _commit_merge needs"""
+    start = live.index.ntotal
+    # Merging into a copy also means a failure leaves the session's documents as they were
+    staged = staged_copy(live)
+    try:
+        # Append the new vectors to the copied index; nothing is re-embedded
+        texts = append_new_chunks(staged, vector_store)
+        # A growing collection may now warrant an IVF index
+        maybe_reindex(staged)
+    except Exception as e:
+        session_logger.error(f"Vector merge failed for session {session_id[:8]}..., kept existing documents: {e}")
+        raise
+    return staged, start, texts
+
+def _commit_merge(session_id: str, live, staged, start: int, texts):
+    """Swap a staged merge into the session's store; the caller holds the vector lock"""
+    commit_staged(live, staged)
+    index_new_chunks(live, start, texts)
+    session_logger.info(f"Merged vector store for session {session_id[:8]}... ({len(texts)} new chunks)")
+
+def _is_stale(session_id: str, session: dict) -> bool:
+    """True if another worker saved (or deleted) the session since it was cached"""
+    return MULTI_WORKER and storage.session_version(session_id) != session.get("version", 0)
+
 def get_session(session_id: str):
     # Try memory cache first
-    if session_id in active_sessions:
-        return active_sessions[session_id]
+    session = active_sessions.get(session_id)
+    if session is not None and not _is_stale(session_id, session):
+        return session
     
-    # Load from disk
-    session_data = storage.load_session(session_id)
-    if session_data:
-        # Cache in memory
-        active_sessions[session_id] = session_data
-        return session_data
+    # Load from disk; under the lock so no worker is halfway through saving it
+    with storage.session_lock(session_id):
+        # Another thread may have loaded it while we waited
+        session = active_sessions.peek(session_id)
+        if session is not None:
+            if not _is_stale(session_id, session):
+                return session
+            # Requests still holding the old copy finish with it
+            if session_id in active_sessions:
+                del active_sessions[session_id]
+            session_logger.debug(f"Reloading session {session_id[:8]}... saved by another worker")
+        # Evicted before its queued save landed, the cached copy is newer than the stored one
+        session_data = None if MULTI_WORKER else persistence.queued_session(session_id)
+        if session_data is None:
+            session_data = storage.load_session(session_id)
+        if session_data:
+            if session_data.get("profile") is None:
+                # Saved before profiles existed; extract once from the history
+                session_data["profile"] = build_profile(session_data["chat_history"])
+            # Cache in memory
+            active_sessions[session_id] = session_data
+            return session_data
     
     return None
 
 def add_message(session_id: str, role: str, content: str):
+    with storage.session_lock(session_id):
+        _add_message(session_id, role, content)
+
+def _add_message(session_id: str, role: str, content: str):
     session = get_session(session_id)
     if session:
         session["chat_history"].append({
@@ -108,31 +270,89 @@ def add_message(session_id: str, role: str, content: str):
         })
         session["last_activity"] = time.time()
         
-        # Update cache
-        active_sessions[session_id] = session
+        # Extract profile facts once, as they are stated
+        if role == "user":
+            update_profile(session.setdefault("profile", {}), content)
+        
+        # Update cache recency and size estimate
+        active_sessions.touch(session_id, len(content) + MESSAGE_OVERHEAD_BYTES)
         
-        # Save to disk
-        storage.save_session(session_id, session)
+        # Queue for saving to disk; vectors are unchanged
+        _save(session_id, session)
+
+def set_summary(session_id: str, text: str, covered: int):
+    """Store the rolling summary of the first covered messages"""
+    with storage.session_lock(session_id):
+        session = get_session(session_id)
+        if session:
+            # Replaced wholesale so the persistence thread never sees a half update
+            session["summary"] = {"text": text, "covered": covered}
+            _save(session_id, session)
 
 def get_chat_history(session_id: str):
     session = get_session(session_id)
     return session["chat_history"] if session else []
 
+def get_chat_history_page(session_id: str, offset: int = 0, limit: int = None):
+    """Page of chat history plus session metadata, without loading idle sessions into memory"""
+    session = active_sessions.get(session_id)
+    if session is not None and not _is_stale(session_id, session):
+        history = session["chat_history"]
+        return {
+            "history": history[offset:offset + limit] if limit is not None else history[offset:],
+            "total": len(history),
+            "filename": session.get("filename", ""),
+            "has_vector_store": session.get("vector_store") is not None or bool(session.get("has_vector_store"))
+        }
+    
+    # Not resident: everything it has is already on disk, read just the requested lines
+    metadata = storage.load_metadata(session_id)
+    if metadata is None:
+        return None
+    return {
+        "history": storage.load_history(session_id, offset, limit),
+        "total": metadata.get("message_count", 0),
+        "filename": metadata.get("filename", ""),
+        "has_vector_store": metadata.get("has_vector_store", False)
+    }
+
 def delete_session(session_id: str):
     """Delete a specific session"""
-    if session_id in active_sessions:
-        del active_sessions[session_id]
-    
-    # Delete from disk
-    session_file = f"{storage.storage_dir}/sessions/{session_id}.json"
-    if os.path.exists(session_file):
-        os.remove(session_file)
-    
-    # Delete vector store
-    vector_path = f"{storage.storage_dir}/vectors/{session_id}"
-    if os.path.exists(vector_path):
-        shutil.rmtree(vector_path)
+    # The vector lock keeps an in-flight write-behind save from recreating the files
+    with storage.session_lock(session_id), persistence.session_lock(session_id):
+        persistence.discard(session_id)
+        if session_id in active_sessions:
+            vector_store = active_sessions[session_id].get("vector_store")
+            if isinstance(getattr(vector_store, "docstore", None), SQLiteDocstore):
+                vector_store.docstore.close()
+            del active_sessions[session_id]
+        
+        # Delete from disk
+        storage.delete_session(session_id)
 
 def cleanup_old_sessions():
     """Clean up sessions older than 7 days"""
-    storage.cleanup_old_sessions(7)
\ No newline at end of file
+    # Every worker trims its own cache; only the elected one deletes from storage
+    active_sessions.evict_expired()
+    if cleanup_leader.try_acquire():
+        storage.cleanup_old_sessions(7)
+
+def cache_stats() -> dict:
+    """Hit rate, evictions and estimated memory of the resident session cache"""
+    return active_sessions.stats()
+
+def resident_vectors() -> int:
+    """Vectors held by resident sessions whose stores are loaded"""
+    total = 0
+    for session in active_sessions.sessions():
+        vector_store = session.get("vector_store")
+        if vector_store is not None:
+            index = getattr(vector_store, "index", None)
+            total += index.ntotal if index is not None else vector_store.ntotal
+    return total
+
+def shutdown():
+    """Flush all pending session writes to disk"""
+    persistence.stop()
+    if storage.vector_index is not None:
+        storage.vector_index.save(force=True)
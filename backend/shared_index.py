@@ -0,0 +1,323 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from bm25_index import BM25Index
+from faiss_store import chunk_hash
+from logger import storage_logger
+
+# "session" (one FAISS folder per session) or "shared" (one sharded index for all sessions)
+VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "session")
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "4"))
+# Seconds between writes of changed shard files; the SQLite rows are always current
+VECTOR_SAVE_INTERVAL = float(os.getenv("VECTOR_SAVE_INTERVAL", "60"))
+# Sessions with more chunks than this search through an IDSelector instead of
+# reconstructing their vectors and scoring them directly
+VECTOR_SELECTOR_MIN_IDS = int(os.getenv("VECTOR_SELECTOR_MIN_IDS", "4096"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    vector_id INTEGER PRIMARY KEY,
+    chunk_hash TEXT NOT NULL UNIQUE,
+    content TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_chunks (
+    session_id TEXT NOT NULL,
+    vector_id INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (session_id, vector_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_session_chunks_vector ON session_chunks(vector_id);
+"""
+
+class SharedVectorIndex:
+    """One vector index for every session, sharded by vector id.
+
+    Chunks are stored once by content hash and linked to each session
+    that uploaded them, so tenants with the same document share vectors.
+    Metadata (filename, page) stays per session. Searches only see the
+    session's own chunks. SQLite holds the chunk text, the vectors and
+    the links; the shard files are a cache rebuilt from it when stale.
+    """
+
+    def __init__(self, path: str, shards: int = VECTOR_SHARDS, save_interval: float = VECTOR_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(f"{path}/chunks.db", check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+        self._shards: List[Optional[faiss.Index]] = [self._load_shard(i, shards) for i in range(shards)]
+        self._dirty = set()
+        self._last_save = time.time()
+        # session id -> its vector ids, filled on first search
+        self._session_ids: Dict[str, np.ndarray] = {}
+
+    def _shard_file(self, shard: int) -> str:
+        return f"{self.path}/shard_{shard}.faiss"
+
+    def _load_shard(self, shard: int, shards: int) -> Optional[faiss.Index]:
+        rows = self._conn.execute(
+            "SELECT COUNT(*) FROM chunks WHERE vector_id % ? = ?", (shards, shard)
+        ).fetchone()[0]
+        if os.path.exists(self._shard_file(shard)):
+            index = faiss.read_index(self._shard_file(shard))
+            if index.ntotal == rows:
+                return index
+            storage_logger.warning(f"Shard {shard} is stale ({index.ntotal} vectors, {rows} chunks), rebuilding")
+        if rows == 0:
+            return None
+        # Rebuild from the vectors kept in SQLite (first run or after a crash between saves)
+        index = None
+        cursor = self._conn.execute(
+            "SELECT vector_id, vector FROM chunks WHERE vector_id % ? = ?", (shards, shard)
+        )
+        while True:
+            batch = cursor.fetchmany(10000)
+            if not batch:
+                break
+            vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in batch])
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            index.add_with_ids(vectors, np.array([vector_id for vector_id, _ in batch], dtype=np.int64))
+        return index
+
+    def _shard_of(self, vector_ids: np.ndarray) -> np.ndarray:
+        return vector_ids % len(self._shards)
+
+    def has_session(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM session_chunks WHERE session_id = ? LIMIT 1", (session_id,)).fetchone()
+        return row is not None
+
+    def view(self, session_id: str) -> "SessionVectorView":
+        return SessionVectorView(self, session_id)
+
+    def add_store(self, session_id: str, vector_store) -> int:
+        """Link a freshly built FAISS store's chunks to a session; returns chunks new to the session"""
+        entries = []
+        for position, doc_id in sorted(vector_store.index_to_docstore_id.items()):
+            doc = vector_store.docstore.search(doc_id)
+            entries.append((chunk_hash(doc), doc, vector_store.index.reconstruct(position)))
+        return self.add(session_id, entries)
+
+    def add(self, session_id: str, entries: List[Tuple[str, Document, np.ndarray]]) -> int:
+        """Link (chunk hash, document, vector) entries to a session, storing vectors only once"""
+        with self._lock, self._conn:
+            existing = {}
+            hashes = list({h for h, _, _ in entries})
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                existing.update(self._conn.execute(
+                    f"SELECT chunk_hash, vector_id FROM chunks WHERE chunk_hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            linked = {row[0] for row in self._conn.execute(
+                "SELECT vector_id FROM session_chunks WHERE session_id = ?", (session_id,)
+            )}
+
+            new_ids, new_vectors, links = [], [], []
+            for h, doc, vector in entries:
+                vector_id = existing.get(h)
+                if vector_id is None:
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vector_id = self._conn.execute(
+                        "INSERT INTO chunks (chunk_hash, content, vector) VALUES (?, ?, ?)",
+                        (h, doc.page_content, vector.tobytes())
+                    ).lastrowid
+                    existing[h] = vector_id
+                    new_ids.append(vector_id)
+                    new_vectors.append(vector)
+                if vector_id not in linked:
+                    linked.add(vector_id)
+                    links.append((session_id, vector_id, json.dumps(doc.metadata)))
+
+            self._conn.executemany(
+                "INSERT INTO session_chunks (session_id, vector_id, metadata) VALUES (?, ?, ?)", links
+            )
+            self._conn.executemany(
+                "UPDATE chunks SET refs = refs + 1 WHERE vector_id = ?", [(vector_id,) for _, vector_id, _ in links]
+            )
+            if new_ids:
+                self._add_vectors(np.array(new_ids, dtype=np.int64), np.stack(new_vectors))
+            self._session_ids.pop(session_id, None)
+        return len(links)
+
+    def _add_vectors(self, ids: np.ndarray, vectors: np.ndarray):
+        shard_of = self._shard_of(ids)
+        for shard in np.unique(shard_of):
+            mask = shard_of == shard
+            if self._shards[shard] is None:
+                self._shards[shard] = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            self._shards[shard].add_with_ids(vectors[mask], ids[mask])
+            self._dirty.add(int(shard))
+
+    def session_vector_ids(self, session_id: str) -> np.ndarray:
+        with self._lock:
+            ids = self._session_ids.get(session_id)
+            if ids is None:
+                rows = self._conn.execute(
+                    "SELECT vector_id FROM session_chunks WHERE session_id = ?", (session_id,)
+                ).fetchall()
+                ids = np.array([row[0] for row in rows], dtype=np.int64)
+                self._session_ids[session_id] = ids
+            return ids
+
+    def search(self, session_id: str, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        """(vector id, squared L2 distance) of the session's k nearest chunks"""
+        query = np.asarray([query_vector], dtype=np.float32)
+        with self._lock:
+            ids = self.session_vector_ids(session_id)
+            if len(ids) == 0:
+                return []
+            shard_of = self._shard_of(ids)
+            hits = []
+            for shard in np.unique(shard_of):
+                index = self._shards[shard]
+                shard_ids = ids[shard_of == shard]
+                if len(shard_ids) < VECTOR_SELECTOR_MIN_IDS:
+                    # Few chunks: scoring them directly beats scanning the shard
+                    vectors = index.reconstruct_batch(shard_ids)
+                    distances = ((vectors - query) ** 2).sum(axis=1)
+                    best = np.argsort(distances)[:k]
+                    hits.extend(zip(shard_ids[best].tolist(), distances[best].tolist()))
+                else:
+                    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(shard_ids))
+                    distances, found = index.search(query, k, params=params)
+                    hits.extend((int(i), float(d)) for i, d in zip(found[0], distances[0]) if i >= 0)
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    def documents(self, session_id: str, vector_ids: List[int]) -> List[Document]:
+        if not vector_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT c.vector_id, c.content, s.metadata FROM chunks c
+                    JOIN session_chunks s ON s.vector_id = c.vector_id AND s.session_id = ?
+                    WHERE c.vector_id IN ({','.join('?' * len(vector_ids))})""",
+                [session_id, *vector_ids]
+            ).fetchall()
+        by_id = {vector_id: Document(page_content=content, metadata=json.loads(metadata)) for vector_id, content, metadata in rows}
+        return [by_id[vector_id] for vector_id in vector_ids if vector_id in by_id]
+
+    def session_texts(self, session_id: str) -> List[Tuple[int, str]]:
+        """(vector id, chunk text) of every chunk linked to the session"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT c.vector_id, c.content FROM chunks c JOIN session_chunks s ON s.vector_id = c.vector_id WHERE s.session_id = ?",
+                (session_id,)
+            ).fetchall()
+
+    def reconstruct(self, vector_id: int) -> np.ndarray:
+        with self._lock:
+            return self._shards[vector_id % len(self._shards)].reconstruct(vector_id)
+
+    def chunk_hashes(self, session_id: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT c.chunk_hash FROM chunks c JOIN session_chunks s ON s.vector_id = c.vector_id WHERE s.session_id = ?",
+                (session_id,)
+            )]
+
+    def delete_session(self, session_id: str) -> int:
+        """Unlink a session's chunks and drop vectors no other session uses"""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT vector_id FROM session_chunks WHERE session_id = ?", (session_id,)
+            )]
+            if not ids:
+                return 0
+            self._conn.execute("DELETE FROM session_chunks WHERE session_id = ?", (session_id,))
+            self._conn.executemany("UPDATE chunks SET refs = refs - 1 WHERE vector_id = ?", [(i,) for i in ids])
+            # Only the chunks just unlinked can have dropped to zero references
+            orphans = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                orphans.extend(row[0] for row in self._conn.execute(
+                    f"SELECT vector_id FROM chunks WHERE refs <= 0 AND vector_id IN ({','.join('?' * len(batch))})", batch
+                ))
+            orphans = np.array(orphans, dtype=np.int64)
+            if len(orphans):
+                self._conn.executemany("DELETE FROM chunks WHERE vector_id = ?", [(int(i),) for i in orphans])
+                shard_of = self._shard_of(orphans)
+                for shard in np.unique(shard_of):
+                    self._shards[shard].remove_ids(faiss.IDSelectorBatch(orphans[shard_of == shard]))
+                    self._dirty.add(int(shard))
+            self._session_ids.pop(session_id, None)
+        return len(ids)
+
+    def save(self, force: bool = False):
+        """Write changed shards, at most every save_interval seconds unless forced"""
+        with self._lock:
+            if not self._dirty or (not force and time.time() - self._last_save < self.save_interval):
+                return
+            for shard in sorted(self._dirty):
+                tmp = f"{self._shard_file(shard)}.tmp"
+                faiss.write_index(self._shards[shard], tmp)
+                os.replace(tmp, self._shard_file(shard))
+            self._dirty.clear()
+            self._last_save = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions, links = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM session_chunks"
+            ).fetchone()
+            return {
+                "sessions": sessions,
+                "session_chunks": links,
+                "vectors": sum(index.ntotal for index in self._shards if index is not None),
+                "shards": len(self._shards)
+            }
+
+class SessionVectorView:
+    """One session's slice of the shared index, searched like a FAISS store"""
+
+    def __init__(self, shared: SharedVectorIndex, session_id: str):
+        self.shared = shared
+        self.session_id = session_id
+        self._bm25 = None
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.shared.session_vector_ids(self.session_id))
+
+    def chunk_hashes(self) -> List[str]:
+        return self.shared.chunk_hashes(self.session_id)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> List[Document]:
+        return self.documents(self.search_ids(embedding, k))
+
+    def search_ids(self, query_vector, k: int = 4) -> List[int]:
+        return [vector_id for vector_id, _ in self.shared.search(self.session_id, query_vector, k)]
+
+    def documents(self, vector_ids: List[int]) -> List[Document]:
+        return self.shared.documents(self.session_id, vector_ids)
+
+    def lexical_index(self) -> BM25Index:
+        """BM25 index of the session's chunks keyed by vector id, built on first use"""
+        if self._bm25 is None:
+            bm25 = BM25Index()
+            bm25.add(self.shared.session_texts(self.session_id))
+            self._bm25 = bm25
+        return self._bm25
+
+    def top_similarity(self, query_vector) -> float:
+        """Cosine similarity between the query and the session's nearest chunk"""
+        hits = self.shared.search(self.session_id, query_vector, 1)
+        if not hits:
+            return 0.0
+        query = np.asarray(query_vector, dtype=np.float32)
+        nearest = self.shared.reconstruct(hits[0][0])
+        norms = np.linalg.norm(query) * np.linalg.norm(nearest)
+        return float(np.dot(query, nearest) / norms) if norms else 0.0
@@ -0,0 +1,193 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from persistent_storage import SessionStore
+from metrics import span, timed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    last_activity REAL NOT NULL,
+    has_vector_store INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    profile TEXT,
+    summary TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions(last_activity);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+class SQLiteStorage(SessionStore):
+    """SQLite backend: session metadata and messages in indexed tables (WAL mode)"""
+
+    def __init__(self, storage_dir="data", db_name="sessions.db"):
+        super().__init__(storage_dir)
+        self.db_path = f"{storage_dir}/{db_name}"
+        # One connection per thread; WAL lets readers run alongside the writer thread
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            # Columns added after the first release; NULL means not yet computed
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}
+            for column, definition in (("profile", "TEXT"), ("summary", "TEXT"), ("version", "INTEGER NOT NULL DEFAULT 0")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {definition}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save_session(self, session_id: str, session_data: dict, save_vectors: bool = True):
+        """Upsert session metadata and insert messages added since the last save"""
+        # Vectors go first, so a row never announces a version whose vectors are not on disk yet
+        if save_vectors and session_data.get("vector_store"):
+            self.save_vectors(session_id, session_data["vector_store"])
+
+        # Vector writes are timed separately as vector_save
+        with span("session_save"):
+            chat_history = session_data.get("chat_history", [])
+            conn = self._conn()
+            with conn:
+                row = conn.execute(
+                    "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                logged = row["message_count"] if row else 0
+                if logged > len(chat_history):
+                    # History was replaced wholesale; start over
+                    conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    logged = 0
+
+                conn.executemany(
+                    "INSERT OR REPLACE INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (session_id, seq, msg["role"], msg["content"], msg.get("timestamp"))
+                        for seq, msg in enumerate(chat_history[logged:], start=logged)
+                    ]
+                )
+                conn.execute(
+                    """INSERT INTO sessions (session_id, filename, created_at, last_activity, has_vector_store, message_count, profile, summary, version)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(session_id) DO UPDATE SET
+                           filename = excluded.filename,
+                           last_activity = excluded.last_activity,
+                           has_vector_store = excluded.has_vector_store,
+                           message_count = excluded.message_count,
+                           profile = excluded.profile,
+                           summary = excluded.summary,
+                           version = excluded.version""",
+                    (
+                        session_id,
+                        session_data.get("filename", ""),
+                        session_data.get("created_at", time.time()),
+                        session_data.get("last_activity", time.time()),
+                        int(self._has_vectors(session_data)),
+                        len(chat_history),
+                        json.dumps(session_data.get("profile") or {}),
+                        json.dumps(session_data["summary"]) if session_data.get("summary") else None,
+                        session_data.get("version", 0)
+                    )
+                )
+
+    def load_metadata(self, session_id: str) -> Optional[dict]:
+        """Load the session row without its history or vectors"""
+        row = self._conn().execute(
+            "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        metadata = dict(row)
+        metadata["has_vector_store"] = bool(metadata["has_vector_store"])
+        for column in ("profile", "summary"):
+            metadata[column] = json.loads(metadata[column]) if metadata[column] is not None else None
+        return metadata
+
+    def load_history(self, session_id: str, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Read a page of chat history using the (session_id, seq) primary key"""
+        rows = self._conn().execute(
+            "SELECT role, content, timestamp FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (session_id, offset, limit if limit is not None else -1)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    @timed("session_load")
+    def load_session(self, session_id: str) -> Optional[dict]:
+        """Load session data from the database"""
+        try:
+            metadata = self.load_metadata(session_id)
+            if metadata is None:
+                return None
+
+            session_data = {
+                "session_id": metadata["session_id"],
+                "filename": metadata["filename"],
+                "chat_history": self.load_history(session_id),
+                "created_at": metadata["created_at"],
+                "last_activity": metadata["last_activity"],
+                "profile": metadata["profile"],
+                "summary": metadata["summary"],
+                "version": metadata["version"],
+                # Attached on first search by session_manager.get_vector_store
+                "vector_store": None,
+                "has_vector_store": metadata["has_vector_store"]
+            }
+
+            return session_data
+
+        except Exception as e:
+            return None
+
+    def session_exists(self, session_id: str) -> bool:
+        """Check if session exists"""
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def session_version(self, session_id: str) -> Optional[int]:
+        """Version column of the session row, or None if it does not exist"""
+        row = self._conn().execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row["version"] if row is not None else None
+
+    def delete_session(self, session_id: str):
+        """Delete a session's rows and its vector store"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self.delete_vectors(session_id)
+
+    def cleanup_old_sessions(self, max_age_days=7):
+        """Clean up sessions older than max_age_days with one indexed range query"""
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        expired = [
+            row["session_id"]
+            for row in self._conn().execute(
+                "SELECT session_id FROM sessions WHERE last_activity < ?", (cutoff,)
+            )
+        ]
+        for session_id in expired:
+            try:
+                self.delete_session(session_id)
+            except Exception as e:
+                pass
+        return len(expired)
@@ -0,0 +1,107 @@
+import re
+from typing import List, Optional
+
+# Most recent likes kept per profile
+MAX_LIKES = 20
+
+_NAME = [
+    re.compile(r"\bmy name is\s+([A-Za-z][\w'-]*)", re.IGNORECASE),
+    # Not "I am X": "I'm Sorry" or "I am Happy" would be taken for a name
+    re.compile(r"\bcall me\s+([A-Za-z][\w'-]*)", re.IGNORECASE)
+]
+_NOT_NAMES = {"from", "in", "at", "working", "not", "so", "very", "here", "fine", "good", "looking", "living", "trying"}
+_AGE = [
+    re.compile(r"\b(?:i am|i'm)\s+(\d{1,3})\s*(?:years?\s*old|yrs?\b|y/?o\b)", re.IGNORECASE),
+    re.compile(r"\bmy age is\s+(\d{1,3})\b", re.IGNORECASE)
+]
+_JOB = re.compile(r"\b(?:i work|my job|i am an? |i'm an? )", re.IGNORECASE)
+# A fact runs to the end of its clause or to the next "and I ..."/"but my ..."
+_CLAUSE = r"([^.!?,;]+?)(?=\s+(?:and|but)\s+(?:i|my)\b|[.!?,;]|$)"
+_LIKES = [
+    re.compile(r"\bi (?:really )?(?:like|love|enjoy)\s+" + _CLAUSE, re.IGNORECASE),
+    re.compile(r"\bmy favou?rite\s+([\w ]+?)\s+is\s+" + _CLAUSE, re.IGNORECASE),
+    re.compile(r"\bmy hobby is\s+" + _CLAUSE, re.IGNORECASE)
+]
+_LOCATION = re.compile(r"\b(?:i live in|i'm from|i am from|i'm based in|i am based in)\s+" + _CLAUSE, re.IGNORECASE)
+# Questions mention facts ("what is my job?") without stating them; checked per sentence
+_QUESTION = re.compile(r"^\s*(?:what|who|where|when|why|how|do|does|did|can|could|tell|is|are)\b|\?\s*$", re.IGNORECASE)
+_SENTENCE = re.compile(r"[^.!?]+[.!?]?")
+
+def extract_facts(text: str) -> dict:
+    """Profile facts stated in one user message"""
+    facts = {}
+    # "My name is Bob. Can you help me?" still states the name
+    text = " ".join(s.strip() for s in _SENTENCE.findall(text) if not _QUESTION.search(s))
+    if not text:
+        return facts
+
+    for pattern in _NAME:
+        match = pattern.search(text)
+        if match and match.group(1).lower() not in _NOT_NAMES:
+            facts["name"] = match.group(1)
+            break
+
+    for pattern in _AGE:
+        match = pattern.search(text)
+        if match:
+            facts["age"] = match.group(1)
+            break
+
+    match = _JOB.search(text)
+    if match:
+        # Keep the whole statement; job descriptions rarely fit a pattern
+        facts["job"] = _sentence_at(text, match.start())
+
+    likes = []
+    for pattern in _LIKES:
+        for match in pattern.finditer(text):
+            like = " is ".join(g.strip() for g in match.groups())
+            likes.append(like)
+    if likes:
+        facts["likes"] = likes
+
+    match = _LOCATION.search(text)
+    if match:
+        facts["location"] = match.group(1).strip()
+
+    return facts
+
+def update_profile(profile: dict, text: str) -> bool:
+    """Merge facts from a user message into profile; returns True if it changed.
+
+    Values are replaced rather than mutated so a shallow copy of the
+    profile is a consistent snapshot for the persistence thread.
+    """
+    facts = extract_facts(text)
+    if not facts:
+        return False
+    likes = facts.pop("likes", None)
+    if likes:
+        kept = [like for like in profile.get("likes", []) if like not in likes]
+        profile["likes"] = (kept + likes)[-MAX_LIKES:]
+    profile.update(facts)
+    return True
+
+def build_profile(chat_history: List[dict]) -> dict:
+    """Profile for sessions saved before profiles existed"""
+    profile = {}
+    for msg in chat_history:
+        if msg["role"] == "user":
+            update_profile(profile, msg["content"])
+    return profile
+
+def describe_profile(profile: dict) -> Optional[str]:
+    """Known facts as prompt context, or None if there are none"""
+    lines = []
+    for key, label in (("name", "Name"), ("age", "Age"), ("job", "Work"), ("location", "Location")):
+        if profile.get(key):
+            lines.append(f"{label}: {profile[key]}")
+    if profile.get("likes"):
+        lines.append(f"Likes: {', '.join(profile['likes'])}")
+    return "\n".join(lines) or None
+
+def _sentence_at(text: str, position: int) -> str:
+    for match in _SENTENCE.finditer(text):
+        if match.start() <= position < match.end():
+            return match.group(0).strip()
+    return text.strip()
@@ -0,0 +1,100 @@
+import importlib
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+from logger import main_logger
+from metrics import observe_stage
+
+# Load the embedding model and run a first inference on a background thread
+# at startup; "0" leaves all of it to the first request that needs it
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+# Modules kept out of `import main` for a fast start; the warmup imports them
+# so the first upload or question does not pay for them
+DEFERRED_IMPORTS = (
+    "langchain_community.document_loaders",
+    "langchain.text_splitter",
+    "langchain_community.vectorstores",
+    "langchain_community.embeddings",
+    "pypdf",
+    "httpx",
+)
+
+WARMUP_TEXTS = ["Warming up the embedding model.", "A second sentence so the batch path runs too."]
+
+def import_deferred():
+    for module in DEFERRED_IMPORTS:
+        importlib.import_module(module)
+
+def load_model():
+    from embeddings import get_embeddings
+    get_embeddings()
+
+def run_inference():
+    # The first forward pass allocates torch's buffers and thread pool
+    from embeddings import get_embeddings
+    model = get_embeddings()
+    model.embed_query(WARMUP_TEXTS[0])
+    model.embed_documents(WARMUP_TEXTS)
+
+DEFAULT_STEPS = [("imports", import_deferred), ("model_load", load_model), ("inference", run_inference)]
+
+class Warmup:
+    """Runs startup steps on a background thread and reports readiness.
+
+    state goes pending -> running -> ready, or failed if a step raises.
+    When disabled the server reports ready at once and loads lazily.
+    Each step's duration is recorded as the warmup_<name> stage.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable]] = None, enabled: bool = WARMUP_ON_STARTUP):
+        self.steps = list(steps if steps is not None else DEFAULT_STEPS)
+        self.enabled = enabled
+        self.state = "pending" if enabled else "ready"
+        self.current_step = None
+        self.error = None
+        self.durations = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "step": self.current_step,
+            "error": self.error,
+            "durations_s": dict(self.durations),
+            "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+        }
+
+    def _run(self):
+        self.state = "running"
+        self.started_at = time.time()
+        for name, step in self.steps:
+            self.current_step = name
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                main_logger.error(f"Warmup step {name} failed: {e}")
+                self.error = f"{name}: {e}"
+                self.state = "failed"
+                self.finished_at = time.time()
+                return
+            seconds = time.perf_counter() - started
+            self.durations[name] = round(seconds, 3)
+            observe_stage(f"warmup_{name}", seconds)
+        self.current_step = None
+        self.finished_at = time.time()
+        self.state = "ready"
+        main_logger.info(f"Warmup finished in {self.finished_at - self.started_at:.2f}s: {self.durations}")
@@ -0,0 +1,73 @@
+import contextlib
+import fcntl
+import os
+import threading
+import zlib
+from logger import storage_logger
+
+# Set when several server processes share one data directory (see gunicorn.conf.py).
+# Session writes then go straight to storage under a cross-process lock, and
+# cached sessions are reloaded when another worker has saved a newer version.
+MULTI_WORKER = os.getenv("SESSION_MULTI_WORKER", "0") == "1"
+
+# Session ids hash onto this many lock files, so locks never have to be deleted
+LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", "64"))
+
+class StripedFileLock:
+    """Cross-process locks keyed by string, backed by flock on a fixed set of files.
+
+    Keys hash onto one of `stripes` lock files. Within a process a stripe is
+    also guarded by an RLock, so threads queue on it without opening extra
+    descriptors and a thread may re-enter a lock it already holds.
+    """
+
+    def __init__(self, lock_dir: str, stripes: int = LOCK_STRIPES):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._depth = [0] * stripes
+        self._files = [None] * stripes
+
+    @contextlib.contextmanager
+    def hold(self, key: str):
+        stripe = zlib.crc32(key.encode()) % self.stripes
+        with self._locks[stripe]:
+            if self._depth[stripe] == 0:
+                f = open(f"{self.lock_dir}/{stripe}.lock", "a+")
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._files[stripe] = f
+            self._depth[stripe] += 1
+            try:
+                yield
+            finally:
+                self._depth[stripe] -= 1
+                if self._depth[stripe] == 0:
+                    f, self._files[stripe] = self._files[stripe], None
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                    f.close()
+
+class LeaderLock:
+    """Elects one process among those sharing a lock file.
+
+    The first process to take the (non-blocking) flock keeps it until it
+    exits; the kernel then releases it and the next try_acquire elsewhere wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        """True if this process is, or has just become, the leader"""
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        storage_logger.info(f"Process {os.getpid()} elected leader for {os.path.basename(self.path)}")
+        return True
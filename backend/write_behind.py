@@ -0,0 +1,128 @@
+import atexit
+import os
+import threading
+from logger import storage_logger
+
+# Seconds between background flushes; 0 writes every change through immediately
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2.0"))
+
+class WriteBehindWriter:
+    """Coalesces session saves and flushes them to storage on a background thread.
+
+    Callers mark a session dirty after changing it. Repeated changes to the
+    same session between flushes collapse into a single write, and the
+    vector store is only written when a change explicitly marked it dirty.
+    """
+
+    def __init__(self, storage, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self._pending = {}  # session_id -> (session_data, save_vectors, generation)
+        # Entries taken by a flush that is still writing them
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._session_locks = {}
+        # Bumped when a session is deleted, so writes queued before that are dropped
+        self._generations = {}
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Start the background flush thread (no-op in write-through mode)"""
+        if self.flush_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        storage_logger.info(f"Write-behind persistence started (flush every {self.flush_interval}s)")
+
+    def session_lock(self, session_id: str) -> threading.RLock:
+        """Lock held while a session's vector store is mutated or written"""
+        with self._lock:
+            if session_id not in self._session_locks:
+                self._session_locks[session_id] = threading.RLock()
+            return self._session_locks[session_id]
+
+    def mark_dirty(self, session_id: str, session_data: dict, vectors: bool = False):
+        """Queue a session for saving; vectors=True also rewrites its vector store"""
+        with self._lock:
+            _, pending_vectors, _ = self._pending.get(session_id, (None, False, None))
+            self._pending[session_id] = (session_data, vectors or pending_vectors, self._generations.get(session_id, 0))
+
+        if self.flush_interval <= 0 or self._stopping:
+            self.flush(session_id)
+
+    def discard(self, session_id: str):
+        """Drop pending and in-flight writes for a session being deleted; call with its session_lock held"""
+        with self._lock:
+            self._pending.pop(session_id, None)
+            self._generations[session_id] = self._generations.get(session_id, 0) + 1
+            # The session lock stays: other threads may be waiting on it
+
+    def queued_session(self, session_id: str):
+        """Session data waiting to be written or being written, else None; newer than the stored copy"""
+        with self._lock:
+            entry = self._pending.get(session_id) or self._inflight.get(session_id)
+            if entry is None or entry[2] != self._generations.get(session_id, 0):
+                return None
+            return entry[0]
+
+    def flush(self, session_id: str = None):
+        """Write pending sessions now; all of them when session_id is None"""
+        with self._lock:
+            if session_id is None:
+                batch = self._pending
+                self._pending = {}
+            elif session_id in self._pending:
+                batch = {session_id: self._pending.pop(session_id)}
+            else:
+                batch = {}
+            self._inflight.update(batch)
+
+        for sid, entry in batch.items():
+            session_data, save_vectors, generation = entry
+            try:
+                with self.session_lock(sid):
+                    if generation != self._generations.get(sid, 0):
+                        # Deleted after this write was queued
+                        continue
+                    # Snapshot the history so appends on other threads don't race the encoder
+                    snapshot = dict(session_data)
+                    snapshot["chat_history"] = list(session_data.get("chat_history", []))
+                    snapshot["profile"] = dict(session_data.get("profile") or {})
+                    self.storage.save_session(sid, snapshot, save_vectors=save_vectors)
+            except Exception as e:
+                storage_logger.error(f"Failed to persist session {sid[:8]}...: {e}")
+                with self._lock:
+                    newer = self._pending.get(sid)
+                    if newer is not None:
+                        # A newer change is queued; it just has to write the vectors too
+                        self._pending[sid] = (newer[0], newer[1] or save_vectors, newer[2])
+                    elif generation == self._generations.get(sid, 0):
+                        # Requeue unless the session was deleted meanwhile
+                        self._pending[sid] = entry
+            finally:
+                with self._lock:
+                    if self._inflight.get(sid) is entry:
+                        del self._inflight[sid]
+
+        return len(batch)
+
+    def stop(self):
+        """Stop the background thread and durably flush everything pending"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        flushed = self.flush()
+        storage_logger.info(f"Write-behind persistence stopped, flushed {flushed} session(s)")
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            if self._stopping:
+                break
+            self.flush()
@@ -54,6 +54,16 @@ function App() {
 		loadChatHistory();
 	}, [sessionId]);
 
+	const waitForIngestion = async (jobId) => {
+		while (true) {
+			const { data } = await axios.get(`${API_BASE}/ingest/${jobId}`);
+			if (data.status === 'done' || data.status === 'failed') {
+				return data;
+			}
+			await new Promise(resolve => setTimeout(resolve, 1000));
+		}
+	};
+
 	const handleFileUpload = async (event) => {
 		const file = event.target.files[0];
 		if (!file) return;
@@ -72,8 +82,13 @@ function App() {
 				headers: { 'Content-Type': 'multipart/form-data' }
 			});
 			setSessionId(response.data.session_id);
-			setFilename(response.data.filename);
 			localStorage.setItem('chatbot_session_id', response.data.session_id);
+			// Processing happens in the background; poll the job until it finishes
+			const job = await waitForIngestion(response.data.job_id);
+			if (job.status === 'failed') {
+				throw new Error(job.error || 'Processing failed');
+			}
+			setFilename(job.result.filename);
 			// Add system message without clearing existing messages
 			setMessages(prev => [...prev, {
 				role: 'system',
@@ -82,7 +97,7 @@ function App() {
 		} catch (error) {
 			let errorMsg = error.response?.data?.detail || error.message;
 			if (error.response?.status === 429) {
-				errorMsg = 'You have exceeded your Gemini API quota. Please check your plan or try again later.';
+				errorMsg = 'The server is busy processing other PDFs. Please try again shortly.';
 			}
 			setMessages([{
 				role: 'system',